@@ -4,10 +4,61 @@ try:
 except Exception:
     from django.contrib.admin import ModelAdmin  # fallback
 
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import Room, Question, Vote, Poll, PollOption
+from .services import moderation, search
+from .views import broadcast_moderation
 from django.utils.html import format_html
 from django.utils.timezone import localtime
 
+
+# هر changelist تعداد query ثابت دارد (list_select_related؛ تست در lipapp/tests.py)
+
+def estimated_count(queryset) -> int | None:
+    """
+    تعداد تقریبی سطرهای کل جدول بدون COUNT(*):
+    PostgreSQL از آمار planner (reltuples)، SQLite از MAX(rowid) (حذف‌ها را نمی‌بیند).
+    """
+    conn = connections[queryset.db]
+    table = conn.ops.quote_name(queryset.model._meta.db_table)
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif conn.vendor == "sqlite":
+            cursor.execute(f"SELECT MAX(rowid) FROM {table}")
+        else:
+            return None
+        row = cursor.fetchone()
+    # reltuples = -1 یعنی جدول هنوز ANALYZE نشده
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    برای changelistهای خیلی بزرگ (Vote): بدون فیلتر/جستجو تعداد کل تخمینی است؛
+    با فیلتر همان COUNT دقیق (که با index محدود می‌شود). زیر ADMIN_ESTIMATED_COUNT_MIN دقیق.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_MIN:
+                return estimate
+        return super().count
+
+
+class PollListFilter(admin.RelatedFieldListFilter):
+    """فیلتر Poll با select_related (Poll.__str__ اسلاگ اتاق را می‌خواند)."""
+
+    def field_choices(self, field, request, model_admin):
+        return [(p.pk, str(p)) for p in Poll.objects.select_related("room")]
+
+
 @admin.register(Room)
 class RoomAdmin(ModelAdmin):
     list_display = ("title", "slug", "is_live", "access_mode", "created_at_local", "host_secret_short")
@@ -24,38 +75,53 @@ class RoomAdmin(ModelAdmin):
         return f"{obj.host_secret[:6]}…"
     host_secret_short.short_description = "Host Secret"
 
+def _moderate(modeladmin, request, queryset, action: str, verb: str):
+    """
+    کل انتخاب، batch به batch (moderation.MAX_BATCH سطر در هر UPDATE) + به‌روزرسانی
+    leaderboard/snapshot و یک broadcast برای هر اتاق در هر batch.
+    """
+    total = 0
+    for changes in moderation.batches(queryset, action):
+        broadcast_moderation(changes)
+        total += len(changes)
+    modeladmin.message_user(request, f"{total} question(s) {verb}.")
+
 @admin.action(description="Approve selected questions")
 def action_approve(modeladmin, request, queryset):
-    for q in queryset:
-        q.approve()
+    _moderate(modeladmin, request, queryset, "approve", "approved")
 
 @admin.action(description="Reject selected questions")
 def action_reject(modeladmin, request, queryset):
-    for q in queryset:
-        q.reject()
+    _moderate(modeladmin, request, queryset, "reject", "rejected")
 
 @admin.action(description="Mark selected as answered")
 def action_answered(modeladmin, request, queryset):
-    for q in queryset:
-        q.mark_answered()
+    _moderate(modeladmin, request, queryset, "answer", "marked answered")
 
 @admin.action(description="Pin selected questions")
 def action_pin(modeladmin, request, queryset):
-    for q in queryset:
-        q.pin()
+    _moderate(modeladmin, request, queryset, "pin", "pinned")
 
 @admin.action(description="Unpin selected questions")
 def action_unpin(modeladmin, request, queryset):
-    for q in queryset:
-        q.unpin()
+    _moderate(modeladmin, request, queryset, "unpin", "unpinned")
 
 @admin.register(Question)
 class QuestionAdmin(ModelAdmin):
     list_display = ("short_body", "room", "status_badge", "score_cached", "is_pinned", "created_at_local")
     list_filter = ("status", "room", "created_at")
-    search_fields = ("body", "author_name", "room__slug")
+    search_fields = ("body", "room__slug")
+    list_select_related = ("room",)
     ordering = ("-score_cached", "created_at")
     actions = [action_approve, action_reject, action_answered, action_pin, action_unpin]
+    search_help_text = "Words in the question (prefix match), or exact room slug"
+
+    def get_search_results(self, request, queryset, search_term):
+        """متن سوال از index متن کامل (lipapp.services.search)، نه LIKE '%...%' روی body."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return search.matching(queryset, term) | queryset.filter(room__slug=term), False
 
     def short_body(self, obj):
         text = obj.body
@@ -81,7 +147,22 @@ class QuestionAdmin(ModelAdmin):
 class VoteAdmin(ModelAdmin):
     list_display = ("question", "voter_key_short", "created_at")
     list_filter = ("created_at",)
-    search_fields = ("voter_key", "question__id", "question__room__slug")
+    list_select_related = ("question__room",)
+    raw_id_fields = ("question",)
+    search_fields = ("question__room__slug",)
+    search_help_text = "Question id or exact room slug"
+    # جدول Vote بزرگ‌ترین جدول است: تعداد تخمینی و بدون COUNT دوم برای "N total"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """فقط lookupهای index‌دار: question_id یا اسلاگ دقیق اتاق (نه LIKE روی join)."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(question_id=int(term)), False
+        return queryset.filter(question__room__slug=term), False
 
     def voter_key_short(self, obj):
         return f"{obj.voter_key[:10]}…"
@@ -96,14 +177,34 @@ class PollAdmin(ModelAdmin):
     list_display = ("question", "room", "is_active", "total_votes_display", "created_at")
     list_filter = ("is_active", "room", "created_at")
     search_fields = ("question", "room__slug")
+    list_select_related = ("room",)
     inlines = [PollOptionInline]
 
     def total_votes_display(self, obj):
-        return obj.total_votes_cached
+        return obj.total_votes_cached  # ستون denormalized، بدون query گزینه‌ها
     total_votes_display.short_description = "Total votes"
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recount_votes()  # votes_cached گزینه‌ها در inline دستی ویرایش‌پذیر است
+
 @admin.register(PollOption)
 class PollOptionAdmin(ModelAdmin):
     list_display = ("label", "poll", "votes_cached")
-    list_filter = ("poll",)
+    list_filter = (("poll", PollListFilter),)
+    list_select_related = ("poll__room",)
     search_fields = ("label", "poll__question")
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.poll.recount_votes()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.poll.recount_votes()
+
+    def delete_queryset(self, request, queryset):
+        polls = list(Poll.objects.filter(options__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for poll in polls:
+            poll.recount_votes()
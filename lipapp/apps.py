@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class LipappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lipapp'
+
+    def ready(self):
+        from .services import search
+
+        # بازسازی جدول lipapp_question در migrationهای SQLite triggerهای FTS را پاک می‌کند
+        post_migrate.connect(search.ensure, sender=self)
@@ -0,0 +1,145 @@
+# lipapp/async_views.py
+"""
+مسیر native async برای endpointهای پرترافیک بیننده (ASYNC_VIEWS).
+
+همان رفتار lipapp.views ولی زیر daphne بدون thread hop:
+  - async ORM (aget/acreate/aupdate/aget_or_create) به‌جای sync_to_async دور کل view
+  - Redis روی redis.asyncio (admission، rate-limit، leaderboard، نسخه‌ی snapshot)
+  - broadcast مستقیم در صف publisher (realtime.publish)؛ نوشتن‌ها autocommit هستند
+    پس on_commit لازم نیست و برگشت به event loop با async_to_sync هم نیست.
+    استثنا: رأی سوال (Vote + score_cached) و رأی Poll (دو UPDATE) باید با هم commit شوند
+    (views.count_vote و views.count_poll_vote در sync_to_async).
+contextها قبل از render کامل خوانده می‌شوند (قالب‌ها query تنبل اجرا نمی‌کنند).
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseBadRequest
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_POST
+
+from . import views
+from .models import Room, Question, Poll
+from .realtime import publish
+from .services import admission, dedupe, ingest, leaderboard, snapshot, votes
+from .services.ratelimit import allow_async, Limit, fingerprint, set_rate_headers
+
+logger = logging.getLogger(__name__)
+
+
+async def _room_snapshot(slug: str) -> dict:
+    """مثل views._room_snapshot؛ hit فقط یک GET async است و miss با همان builder sync ساخته می‌شود."""
+    return await snapshot.cache().aget(slug, lambda: views._build_room_snapshot(slug))
+
+
+async def room_view(request, slug):
+    return render(request, "room/view.html", await _room_snapshot(slug))
+
+
+@require_POST
+async def question_create(request, slug):
+    room = await aget_object_or_404(Room, slug=slug, is_live=True)
+
+    fp = fingerprint(request)
+    lim = Limit(limit=1, window=15)
+    ok, remaining, reset = await allow_async(f"q:create:{slug}:{fp}", lim)
+    if not ok:
+        resp = HttpResponseBadRequest("Rate limit exceeded")
+        return set_rate_headers(resp, remaining, reset, lim)
+
+    body = (request.POST.get("body") or "").strip()
+    author = (request.POST.get("author_name") or "").strip() or None
+    if not body:
+        return HttpResponseBadRequest("Empty question")
+
+    if ingest.enabled():
+        try:
+            await ingest.submit_async(room, body, author)
+        except ingest.Backlogged:
+            return views.ingest_backlogged()
+        q = None
+    else:
+        try:
+            sig, duplicate_of = await dedupe.match_async(slug, body)
+        except Exception:
+            logger.warning("dedupe match for room %s failed", slug, exc_info=True)
+            sig, duplicate_of = None, None
+        q = await Question.objects.acreate(
+            room=room, author_name=author, body=body, duplicate_of_id=duplicate_of
+        )  # status = pending
+        try:
+            await dedupe.add_async(slug, q.id, sig)
+        except Exception:
+            logger.warning("dedupe add for question %d failed", q.id, exc_info=True)
+        publish(slug, "host.row", {"items": [views.host_row(q, room)]}, host=True)
+    return views._question_ack(request, room, q)
+
+
+@require_POST
+async def question_vote(request, slug, pk):
+    # اتاق و سوال در یک query (join)
+    q = await aget_object_or_404(
+        Question.objects.select_related("room"),
+        pk=pk,
+        room__slug=slug,
+        room__is_live=True,
+        status__in=[Question.STATUS_APPROVED, Question.STATUS_ANSWERED],
+    )
+    room = q.room
+
+    fp = fingerprint(request)
+    vkey = views.voter_key(request)
+    lim = Limit(limit=5, window=10)
+    verdict = await admission.admit_vote_async(slug, q, fp, vkey, lim)
+    if verdict.status == admission.RATE_LIMITED:
+        resp = HttpResponseBadRequest("Rate limit exceeded")
+        return set_rate_headers(resp, verdict.remaining, verdict.reset, lim)
+    if verdict.status == admission.DEBOUNCED:
+        return HttpResponseBadRequest("Slow down")
+
+    created = False
+    if verdict.status == admission.DUPLICATE:
+        if verdict.score is not None:
+            q.score_cached = verdict.score
+    elif votes.enabled():
+        created, q.score_cached = True, verdict.score
+    else:
+        # Vote و score_cached با هم commit می‌شوند (views.count_vote در sync_to_async)
+        created = await sync_to_async(views.count_vote)(q, vkey)
+        if created:
+            await q.arefresh_from_db(fields=["score_cached"])
+        # بعد از commit؛ خطای بالا voter را علامت نمی‌زند
+        await admission.remember_vote_async(slug, q, vkey)
+    if created:
+        await leaderboard.set_score_async(slug, q)
+        publish(slug, "vote.tally", views.question_delta(q), key=q.id)
+
+    return render(request, "room/_question_card.html", {"q": q, "room": room})
+
+
+@require_POST
+async def poll_vote(request, slug, pk, option_id):
+    poll = await aget_object_or_404(
+        Poll.objects.select_related("room"), pk=pk, room__slug=slug, room__is_live=True, is_active=True
+    )
+    room = poll.room
+
+    fp = fingerprint(request)
+    lim = Limit(limit=5, window=10)
+    ok, remaining, reset = await allow_async(f"poll:vote:{slug}:{fp}", lim)
+    if not ok:
+        resp = HttpResponseBadRequest("Rate limit exceeded")
+        return set_rate_headers(resp, remaining, reset, lim)
+
+    # گزینه و مجموع Poll در یک تراکنش (async ORM تراکنش ندارد؛ یک hop به thread ORM)
+    if not await sync_to_async(views.count_poll_vote)(poll, option_id):
+        return HttpResponseBadRequest("Invalid option")
+    await snapshot.bump_async(slug)
+
+    tally = views.poll_tally(poll, [o async for o in poll.options.all()])
+    publish(slug, "poll.tally", tally, key=poll.id)
+    return render(
+        request,
+        "room/_poll_block.html",
+        {"room": room, "active_poll": poll, "poll_options": tally["options"]},
+    )
@@ -1,22 +1,159 @@
+import json
+import logging
+import secrets
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from .hub import CHANNEL_PREFIX, CLOSE_BUSY, CLOSE_RESYNC, HOST_PREFIX, hub, presence_frame, seq_of
+from .services import identity, presence
+
+logger = logging.getLogger(__name__)
+
+
+class HubConsumer(AsyncJsonWebsocketConsumer):
+    """پایه‌ی مشترک: outbox محدود و عضویت در گروه prefix+slug در hub."""
+    prefix = CHANNEL_PREFIX
+    outbox = None
+
+    @classmethod
+    async def encode_json(cls, content):
+        # بدون فاصله: deltaها ({id, score, status, pinned}) چند ده بایت بیشتر نیستند
+        return json.dumps(content, separators=(",", ":"))
+
+    def open_outbox(self):
+        self.outbox = hub.queue(
+            send=self._write,
+            on_overflow=self._resync,
+            max_frames=settings.WS_SEND_QUEUE_FRAMES,
+            max_bytes=settings.WS_SEND_QUEUE_BYTES,
+            max_lag=settings.WS_SEND_MAX_LAG,
+        )
+
+    async def join_hub(self) -> bool:
+        """عضویت در hub؛ اگر subscribe روی Redis نشد socket با CLOSE_RESYNC بسته می‌شود تا دوباره وصل شود."""
+        try:
+            await hub.join(self.slug, self, prefix=self.prefix)
+        except Exception:
+            logger.warning("joining room %s failed", self.slug, exc_info=True)
+            await self.close(code=CLOSE_RESYNC)
+            return False
+        return True
+
+    async def disconnect(self, code):
+        await hub.leave(self.slug, self, prefix=self.prefix)
+        if self.outbox is not None:
+            self.outbox.close()
+
+    def deliver(self, frame: str):
+        self.outbox.put(frame)
+
+    async def _write(self, frame: str):
+        await self.send(text_data=frame)
+
+    async def _resync(self):
+        # بیش از حد عقب افتاده: بستن با CLOSE_RESYNC تا کلاینت وضعیت را از نو بگیرد
+        await hub.leave(self.slug, self, prefix=self.prefix)
+        await self.close(code=CLOSE_RESYNC)
+
 
-class RoomConsumer(AsyncJsonWebsocketConsumer):
+class RoomConsumer(HubConsumer):
     """
     کلاینت‌ها به ws/room/<slug>/ وصل می‌شن.
-    ما همه‌ی پیام‌ها رو به صورت واحد با type="dispatch" هندل می‌کنیم
-    و یک فیلد event داریم که روی کلاینت سوییچ می‌شه.
+    به‌جای group در channel layer، هر socket در room hub همین پروسه ثبت می‌شود؛
+    hub برای هر اتاق یک subscription روی Redis دارد و frame آماده‌ی JSON را
+    (با فیلد event که روی کلاینت سوییچ می‌شه) مستقیم به deliver می‌دهد.
+    deliver فقط در outbox محدود همین socket می‌گذارد؛ کلاینت کند بقیه را معطل نمی‌کند.
+
+    reconnect با ?since=<seq>: بعد از join، deltaهای since+1.. از لاگ اتاق replay می‌شوند
+    (eventهای زنده‌ی همین فاصله نگه داشته و بعد از replay، بدون تکرار، فرستاده می‌شوند).
+    اگر بازه در لاگ نبود {"event": "snapshot.required", "seq": N} می‌رود.
+
+    بعد از restart یا قطعی Redis همه با هم برمی‌گردند؛ hub.admit() تعداد handshakeهای
+    پروسه را محدود می‌کند و بقیه با CLOSE_BUSY و یک retry_after پخش‌شده رد می‌شوند.
+
+    presence_id (شناسه‌ی امضاشده‌ی بیننده از cookie) در heartbeat شمارش بیننده‌ها می‌رود؛
+    دو tab یک مرورگر یک بیننده حساب می‌شوند.
     """
+    _backlog = None
+
     async def connect(self):
         self.slug = self.scope["url_route"]["kwargs"]["slug"]
-        self.group_name = f"room_{self.slug}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        retry_after = hub.admit()
+        if retry_after:
+            # قبل از accept نمی‌شود close code فرستاد (فقط 403)؛ daphne هم reason را نمی‌فرستد
+            await self.accept()
+            await self.send_json({"event": "busy", "retry_after": retry_after})
+            await self.close(code=CLOSE_BUSY)
+            return
+        self.presence_id = (
+            identity.voter_id_from_cookies(identity.scope_cookies(self.scope))
+            or f"anon:{secrets.token_hex(8)}"
+        )
         await self.accept()
         await self.send_json({"event": "hello", "room": self.slug})
+        self.open_outbox()
+        since = self._since()
+        if since is not None:
+            self._backlog = []
+        if not await self.join_hub():
+            return
+        if since is not None:
+            await self._replay(since)
 
-    async def disconnect(self, code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    def deliver(self, frame: str):
+        # frame یک بار در publisher encode شده؛ فقط برای socketهای عقب‌افتاده دوباره encode می‌شود
+        if self._backlog is not None:
+            self._backlog.append(frame)
+            return
+        self.outbox.put(frame)
+
+    def _since(self) -> int | None:
+        raw = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        if not raw or not raw[0].isdigit():
+            return None
+        return int(raw[0])
+
+    async def _replay(self, since: int):
+        try:
+            current, frames = await hub.log(self.slug).replay(self.slug, since)
+        except Exception:
+            logger.warning("replay for room %s failed", self.slug, exc_info=True)
+            current, frames = 0, None
+        # replay بزرگ‌تر از outbox خودش باعث kick می‌شود؛ snapshot ارزان‌تر است
+        if frames is None or len(frames) > self.outbox.max_frames:
+            hub.sockets["snapshots"] += 1
+            frames = [await self.encode_json({"event": "snapshot.required", "seq": current})]
+        else:
+            hub.sockets["replays"] += 1
+        backlog, self._backlog = self._backlog, None
+        for frame in frames:
+            self.outbox.put(frame)
+        for frame in backlog:
+            if seq_of(frame) > current:
+                self.outbox.put(frame)
 
-    # تمام پیام‌های سرور به این متد می‌آیند
-    async def dispatch(self, event):
-        # event = {"type": "dispatch", "event": "...", "payload": {...}}
-        await self.send_json({"event": event.get("event"), **(event.get("payload") or {})})
+
+class HostConsumer(HubConsumer):
+    """
+    کانال فقط-میزبان ws/host/<slug>/ (احراز با cookie امضاشده‌ی lp_host).
+    شمارش بیننده‌ها با timer در hub push می‌شود؛ اینجا فقط یک بار هنگام اتصال خوانده می‌شود.
+    """
+    prefix = HOST_PREFIX
+
+    async def connect(self):
+        self.slug = self.scope["url_route"]["kwargs"]["slug"]
+        if self.slug not in identity.host_rooms_from_cookies(identity.scope_cookies(self.scope)):
+            await self.close()  # قبل از accept → 403
+            return
+        await self.accept()
+        self.open_outbox()
+        if not await self.join_hub():
+            return
+        try:
+            viewers = (await presence.counts(hub.redis(self.slug), [self.slug]))[self.slug]
+        except Exception:
+            logger.warning("presence count for room %s failed", self.slug, exc_info=True)
+            return
+        self.outbox.put(presence_frame(viewers))
@@ -0,0 +1,420 @@
+"""
+Room hub درون‌پروسه‌ای برای fan-out.
+
+publisher هر event را یک بار به JSON تبدیل و روی کانال Redis room:<slug> منتشر می‌کند.
+هر پروسه‌ی daphne برای هر اتاقی که حداقل یک socket محلی دارد فقط یک subscription دارد
+و همان frame متنی را بدون decode/encode دوباره برای همه‌ی socketهای محلی آن اتاق می‌نویسد.
+برای 10k بیننده روی 4 پروسه: 4 تحویل از Redis و 1 encode، نه 10k.
+
+هر socket یک SocketQueue محدود دارد تا یک کلاینت کند fan-out اتاق را معطل نکند:
+  - مسیر سریع: صف خالی است و frame بدون parse ارسال می‌شود
+  - اگر کلاینت عقب افتاد، tally/updateها با id ادغام می‌شوند (فقط آخرین وضعیت)
+    و فقط برای همین socketهای کند frame دوباره encode می‌شود
+  - اگر باز هم از سقف frame/بایت/سن گذشت، socket با CLOSE_RESYNC بسته می‌شود
+    و ws.js با ?since=<seq> دوباره وصل می‌شود تا deltaهای از دست‌رفته replay شوند
+"""
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .services import presence
+from .services.eventlog import EventLog
+from .services.limiter import LocalGCRA
+from .services.ratelimit import Limit
+from .services.shards import AsyncClients
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "room:"
+HOST_PREFIX = "host:"   # eventهای فقط-میزبان (شمارش بیننده‌ها، ...)؛ در لاگ اتاق نمی‌روند
+
+# close codeها (محدوده‌ی 4000-4999 مخصوص برنامه)
+CLOSE_RESYNC = 4008   # "خیلی عقب افتادی، از نو sync کن"
+CLOSE_BUSY = 4029     # پروسه ظرفیت handshake ندارد؛ قبلش {"event": "busy", "retry_after": s} می‌رود
+
+# eventهایی که وضعیت مطلق یک entity را دارند و می‌شود نسخه‌های قدیمی را دور ریخت.
+# event -> (فیلد id، namespace entity). vote.tally و question.update هر دو question_delta هستند.
+MERGEABLE = {
+    "vote.tally": ("id", "q"),
+    "question.update": ("id", "q"),
+    "poll.tally": ("poll_id", "p"),
+}
+
+
+def channel(slug: str) -> str:
+    return f"{CHANNEL_PREFIX}{slug}"
+
+
+def host_channel(slug: str) -> str:
+    return f"{HOST_PREFIX}{slug}"
+
+
+def _event_of(frame: str) -> str | None:
+    # publisher همیشه event را اول می‌نویسد: {"event":"vote.tally",...}
+    if not frame.startswith('{"event":"'):
+        return None
+    end = frame.find('"', 10)
+    return frame[10:end] if end > 0 else None
+
+
+def presence_frame(viewers: int) -> str:
+    return json.dumps({"event": "presence", "viewers": viewers}, separators=(",", ":"))
+
+
+def seq_of(frame: str) -> int:
+    # eventlog seq را بلافاصله بعد از event می‌گذارد: {"event":"x","seq":12,...}
+    i = frame.find(',"seq":')
+    if i < 0:
+        return 0
+    i += 7
+    j = i
+    while j < len(frame) and frame[j].isdigit():
+        j += 1
+    return int(frame[i:j] or 0)
+
+
+class _Slot:
+    __slots__ = ("event", "frame", "items", "dirty", "at", "size", "seq")
+
+    def __init__(self, event, frame, items=None):
+        self.event = event
+        self.frame = frame
+        self.seq = None         # فقط برای slot ادغام‌شده: seq آخرین frame
+        self.size = len(frame)  # سقف محافظه‌کارانه‌ی بایت‌ها (با ادغام کم نمی‌شود)
+        self.items = items      # برای eventهای mergeable: entity -> item
+        self.dirty = False
+        self.at = time.monotonic()
+
+    def encode(self) -> str:
+        if self.dirty:
+            head = {"event": self.event}
+            if self.seq is not None:
+                head["seq"] = self.seq
+            if self.event == "question.update" and len(self.items) == 1:
+                # delta تکی همان شکل قبلی را دارد؛ batch (moderation گروهی) با items می‌ماند
+                (item,) = self.items.values()
+                body = {**head, **item}
+            else:
+                body = {**head, "items": list(self.items.values())}
+            self.frame = json.dumps(body, separators=(",", ":"))
+            self.dirty = False
+        return self.frame
+
+
+class SocketQueue:
+    """
+    صف خروجی محدود یک socket با یک writer task.
+    send: coroutine که یک frame متنی را روی socket می‌نویسد.
+    on_overflow: coroutine که socket را (با CLOSE_RESYNC) می‌بندد.
+    """
+
+    def __init__(self, send, on_overflow, stats, max_frames=64, max_bytes=256 * 1024, max_lag=10.0):
+        self._send = send
+        self._on_overflow = on_overflow
+        self._stats = stats
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.max_lag = max_lag
+        self._slots: deque[_Slot] = deque()
+        self._owner: dict[tuple, _Slot] = {}   # entity -> slotی که آخرین وضعیتش را دارد
+        self._bytes = 0
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._writer = asyncio.create_task(self._write())
+
+    def __len__(self):
+        return len(self._slots)
+
+    def put(self, frame: str):
+        if self._closed:
+            return
+        event = _event_of(frame)
+        if self._slots and event in MERGEABLE:
+            self._merge(event, frame)
+        else:
+            self._slots.append(_Slot(event, frame))
+            self._bytes += len(frame)
+        head = self._slots[0] if self._slots else None
+        if (
+            len(self._slots) > self.max_frames
+            or self._bytes > self.max_bytes
+            or (head is not None and time.monotonic() - head.at > self.max_lag)
+        ):
+            self._overflow()
+            return
+        self._wakeup.set()
+
+    def _merge(self, event: str, frame: str):
+        # کلاینت عقب است: وضعیت قدیمی همان entityها را از slotهای منتظر حذف کن
+        id_field, ns = MERGEABLE[event]
+        data = json.loads(frame)
+        fresh = data.get("items") or [{k: v for k, v in data.items() if k not in ("event", "seq")}]
+        tail = self._slots[-1]
+        # question.update (تکی یا batch) slot خودش را دارد؛ tallyها در slot آخر همان event جمع می‌شوند
+        if event != "question.update" and tail.event == event and tail.items is not None:
+            tail.dirty = True
+            tail.size += len(frame)
+        else:
+            tail = _Slot(event, frame, {})
+            self._slots.append(tail)
+        tail.seq = data.get("seq")
+        self._bytes += len(frame)
+        for item in fresh:
+            entity = (ns, item.get(id_field))
+            old = self._owner.get(entity)
+            if old is not None:
+                self._stats["merged"] += 1
+                if old is not tail:
+                    old.items.pop(entity, None)
+                    old.dirty = True  # seq خودش را نگه می‌دارد؛ ترتیب seqها در صف حفظ می‌شود
+            tail.items[entity] = item
+            self._owner[entity] = tail
+
+    def _overflow(self):
+        self._stats["dropped"] += len(self._slots)
+        self._stats["kicked"] += 1
+        self.close()
+        asyncio.ensure_future(self._on_overflow())
+
+    def close(self):
+        self._closed = True
+        self._slots.clear()
+        self._owner.clear()
+        self._bytes = 0
+        self._writer.cancel()
+
+    async def _write(self):
+        while True:
+            if not self._slots:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            slot = self._slots.popleft()
+            self._bytes -= slot.size
+            if slot.items is not None:
+                for entity in slot.items:
+                    if self._owner.get(entity) is slot:
+                        del self._owner[entity]
+                if not slot.items:
+                    continue   # همه‌ی وضعیت‌هایش در slotهای جدیدتر است
+            frame = slot.encode()
+            try:
+                await self._send(frame)
+                self._stats["sent"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.debug("room hub: socket send failed", exc_info=True)
+
+
+class RoomHub:
+    """
+    rooms / hosts: slug -> set از consumerهای محلی (بیننده / میزبان)؛ هر consumer متد
+    deliver(frame) دارد. هر دو گروه روی یک اتصال pubsub همین پروسه هستند.
+    """
+
+    def __init__(self):
+        self.rooms: dict[str, set] = {}
+        self.hosts: dict[str, set] = {}
+        self._groups = {CHANNEL_PREFIX: self.rooms, HOST_PREFIX: self.hosts}
+        self._presence = None
+        self.presence_pushes = 0
+        # هر اتاق روی shard خودش است: یک کلاینت، یک pubsub و یک reader به ازای هر shard
+        self._redis = AsyncClients()
+        self._logs: dict[str, EventLog] = {}
+        self._pubsubs: dict[str, object] = {}
+        self._readers: dict[str, asyncio.Task] = {}
+        self._subscriptions: dict[str, asyncio.Future] = {}   # کانال -> subscribe (در جریان یا انجام‌شده)
+        self.messages = 0    # پیام‌های دریافتی از Redis
+        self.delivered = 0   # frameهای تحویل‌شده به صف socketها
+        # شمارنده‌های مشترک همه‌ی SocketQueueهای این پروسه
+        self.sockets = {"sent": 0, "merged": 0, "dropped": 0, "kicked": 0, "replays": 0, "snapshots": 0}
+        # admission روی handshakeها: token bucket درون‌پروسه‌ای (همان GCRA محلی rate limiter)
+        self._accepts = LocalGCRA()
+        self._storm = (0.0, 0)   # (شروع پنجره‌ی 5 ثانیه‌ای، تعداد ردها در آن)
+        self.accepted = 0
+        self.refused = 0
+
+    def admit(self) -> float:
+        """
+        0 یعنی handshake پذیرفته شد؛ وگرنه چند ثانیه بعد دوباره تلاش کند.
+        hint با jitter پخش می‌شود تا کلاینت‌های رد‌شده دوباره همزمان برنگردند.
+        """
+        rate = settings.WS_ACCEPT_RATE
+        if rate <= 0:
+            self.accepted += 1
+            return 0.0
+        burst = max(1, settings.WS_ACCEPT_BURST)
+        allowed, _, retry_ms, _ = self._accepts.check("ws:accept", Limit(limit=burst, window=burst / rate))
+        if allowed:
+            self.accepted += 1
+            return 0.0
+        self.refused += 1
+        now = time.monotonic()
+        start, count = self._storm
+        self._storm = (start, count + 1) if now - start < 5 else (now, 1)
+        # هر چه ردهای اخیر بیشتر، بازه‌ی پخش retry بزرگ‌تر (تقریباً زمان لازم برای پذیرفتن همه)
+        spread = max(1.0, min(30.0, self._storm[1] / rate))
+        return math.ceil((retry_ms / 1000 + random.uniform(0, spread)) * 10) / 10
+
+    def redis(self, slug: str):
+        return self._redis.room(slug)
+
+    def log(self, slug: str) -> EventLog:
+        url = self._redis.url(slug)
+        log = self._logs.get(url)
+        if log is None:
+            log = self._logs[url] = EventLog(self._redis.get(url))
+        return log
+
+    def queue(self, send, on_overflow, **limits) -> SocketQueue:
+        return SocketQueue(send, on_overflow, self.sockets, **limits)
+
+    async def join(self, slug: str, consumer, prefix: str = CHANNEL_PREFIX):
+        """
+        اولین socket اتاق subscribe را شروع می‌کند و socketهایی که در همین فاصله می‌رسند
+        منتظر همان subscribe می‌مانند. اگر شکست بخورد (مثلاً قطعی Redis) همه‌شان از اتاق
+        خارج می‌شوند و خطا را می‌گیرند؛ join بعدی دوباره subscribe می‌کند.
+        """
+        group = self._groups[prefix]
+        name = prefix + slug
+        group.setdefault(slug, set()).add(consumer)
+        subscribing = self._subscriptions.get(name)
+        if subscribing is None:
+            subscribing = self._subscriptions[name] = asyncio.ensure_future(self._subscribe(slug, name))
+        try:
+            # shield: قطع شدن همین socket subscribe مشترک بقیه را cancel نکند
+            await asyncio.shield(subscribing)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self._subscriptions.get(name) is subscribing:
+                del self._subscriptions[name]
+            members = group.get(slug)
+            if members is not None:
+                members.discard(consumer)
+                if not members:
+                    del group[slug]
+            raise
+        if self._presence is None or self._presence.done():
+            self._presence = asyncio.create_task(self._presence_loop())
+
+    async def leave(self, slug: str, consumer, prefix: str = CHANNEL_PREFIX):
+        group = self._groups[prefix]
+        members = group.get(slug)
+        if members is None:
+            return
+        members.discard(consumer)
+        if members:
+            return
+        del group[slug]
+        name = prefix + slug
+        subscribing = self._subscriptions.get(name)
+        if subscribing is not None and not subscribing.done():
+            await asyncio.wait([subscribing])
+        if slug in group:
+            return   # در همین فاصله دوباره کسی join کرد و همان subscription را دارد
+        self._subscriptions.pop(name, None)
+        pubsub = self._pubsubs.get(self._redis.url(slug))
+        if pubsub is not None:
+            await pubsub.unsubscribe(name)
+
+    async def _subscribe(self, slug: str, name: str):
+        url = self._redis.url(slug)
+        pubsub = self._pubsubs.get(url)
+        if pubsub is None:
+            pubsub = self._pubsubs[url] = self._redis.get(url).pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(name)
+        reader = self._readers.get(url)
+        if reader is None or reader.done():
+            self._readers[url] = asyncio.create_task(self._read(pubsub))
+
+    async def _read(self, pubsub):
+        while True:
+            try:
+                if not pubsub.subscribed:
+                    await asyncio.sleep(0.5)
+                    continue
+                msg = await pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("room hub: pubsub read failed")
+                await asyncio.sleep(1)
+                continue
+            if msg is None or msg.get("type") != "message":
+                continue
+            self.messages += 1
+            prefix, _, slug = msg["channel"].partition(":")
+            await self.fanout(slug, msg["data"], prefix=prefix + ":")
+
+    async def fanout(self, slug: str, frame: str, prefix: str = CHANNEL_PREFIX):
+        # deliver فقط در صف socket می‌گذارد؛ هیچ socket کندی این حلقه را معطل نمی‌کند
+        for consumer in list(self._groups[prefix].get(slug, ())):
+            try:
+                consumer.deliver(frame)
+                self.delivered += 1
+            except Exception:
+                logger.debug("room hub: deliver failed", exc_info=True)
+
+    async def _presence_loop(self):
+        """
+        هر PRESENCE_INTERVAL و برای هر shard: یک pipeline PFADD برای بیننده‌های محلی همه‌ی اتاق‌ها، و برای
+        اتاق‌هایی که این پروسه در این بازه claim کرد یک push شمارش روی host:<slug>.
+        هزینه به ازای هر پروسه و بازه است، نه به ازای هر connect.
+        """
+        interval = settings.PRESENCE_INTERVAL
+        while self.rooms or self.hosts:
+            by_shard: dict[str, list[str]] = {}
+            for slug in set(self.rooms) | set(self.hosts):
+                by_shard.setdefault(self._redis.url(slug), []).append(slug)
+            for url, slugs in by_shard.items():
+                try:
+                    await self._presence_tick(self._redis.get(url), slugs, interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.warning("room hub: presence tick failed on %s", url, exc_info=True)
+            # jitter کوچک تا پروسه‌ها همزمان سراغ Redis نروند
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+    async def _presence_tick(self, conn, slugs: list[str], interval: float):
+        await presence.heartbeat(conn, {
+            slug: {c.presence_id for c in self.rooms[slug]} for slug in slugs if slug in self.rooms
+        })
+        mine = await presence.claim(conn, slugs, interval)
+        if mine:
+            pipe = conn.pipeline(transaction=False)
+            for slug, viewers in (await presence.counts(conn, mine)).items():
+                pipe.publish(host_channel(slug), presence_frame(viewers))
+            await pipe.execute()
+            self.presence_pushes += len(mine)
+
+    def stats(self) -> dict:
+        depths = [
+            len(c.outbox)
+            for group in self._groups.values() for m in group.values() for c in m
+            if c.outbox is not None
+        ]
+        return {
+            "rooms": len(self.rooms),
+            "sockets": sum(len(m) for m in self.rooms.values()),
+            "host_sockets": sum(len(m) for m in self.hosts.values()),
+            "presence_pushes": self.presence_pushes,
+            "messages": self.messages,
+            "delivered": self.delivered,
+            "queue_depth": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "accepted": self.accepted,
+            "refused": self.refused,
+            **self.sockets,
+        }
+
+
+hub = RoomHub()
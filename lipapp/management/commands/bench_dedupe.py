@@ -0,0 +1,109 @@
+# lipapp/management/commands/bench_dedupe.py
+import random
+import statistics
+import time
+
+import redis as redis_py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lipapp.services import dedupe
+
+
+def vocabulary(rng: random.Random, size: int) -> list[str]:
+    syllables = ["ka", "lo", "mi", "ne", "ra", "su", "ti", "ve", "zo", "pa", "de", "ri", "mo", "sa", "lu"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def paraphrase(rng: random.Random, words: list[str], vocab: list[str]) -> list[str]:
+    """یک تا دو ویرایش کوچک: حذف یک کلمه، جایگزینی یک کلمه یا جابه‌جایی دو کلمه‌ی کنار هم."""
+    words = list(words)
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(words))
+        edit = rng.random()
+        if edit < 0.33 and len(words) > 6:
+            del words[i]
+        elif edit < 0.66:
+            words[i] = rng.choice(vocab)
+        elif i + 1 < len(words):
+            words[i], words[i + 1] = words[i + 1], words[i]
+    return words
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark near-duplicate detection (MinHash/LSH) on one synthetic room: per-question "
+        "latency at N questions, recall on planted paraphrases, false positives, and brute force for comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=100_000)
+        parser.add_argument("--dup-rate", type=float, default=0.5, help="Share of questions that paraphrase an earlier one.")
+        parser.add_argument("--backend", choices=["local", "redis"], default="local")
+        parser.add_argument("--redis-url", default=settings.REDIS_URL)
+        parser.add_argument("--brute-sample", type=int, default=20, help="Queries timed against a full scan at the end.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        vocab = vocabulary(rng, 20_000)
+        slug = f"bench-dedupe-{rng.getrandbits(32):x}"
+        if opts["backend"] == "redis":
+            conn = redis_py.from_url(opts["redis_url"], decode_responses=True)
+            index = dedupe.RedisLSH(conn=conn)
+        else:
+            conn, index = None, dedupe.LocalLSH()
+
+        family, sigs, originals = [], [], []
+        latencies, candidates = [], 0
+        found = missed = false_positive = 0
+        try:
+            for qid in range(1, opts["questions"] + 1):
+                if originals and rng.random() < opts["dup_rate"]:
+                    source = rng.choice(originals)
+                    words, fam = paraphrase(rng, source[1], vocab), source[0]
+                else:
+                    words, fam = [rng.choice(vocab) for _ in range(rng.randint(8, 16))], qid
+                    originals.append((qid, words))
+                text = " ".join(words)
+
+                start = time.perf_counter()
+                sig = dedupe.signature(text)
+                found_candidates = index.find(slug, sig)
+                match = dedupe.best_match(sig, found_candidates)
+                index.add(slug, qid, sig)
+                latencies.append(time.perf_counter() - start)
+
+                candidates += len(found_candidates)
+                family.append(fam)
+                sigs.append(sig)
+                if fam != qid:
+                    if match is not None and family[match - 1] == fam:
+                        found += 1
+                    else:
+                        missed += 1
+                elif match is not None:
+                    false_positive += 1
+
+            # همان پرسش با مقایسه‌ی خطی با همه‌ی signatureها (بدون LSH)
+            brute = []
+            for sig in rng.sample(sigs, min(opts["brute_sample"], len(sigs))):
+                start = time.perf_counter()
+                dedupe.best_match(sig, enumerate(sigs, start=1))
+                brute.append(time.perf_counter() - start)
+        finally:
+            if conn is not None:
+                conn.delete(dedupe.bands_key(slug), dedupe.sigs_key(slug))
+
+        total = len(latencies)
+        cuts = statistics.quantiles(latencies, n=100)
+        last = statistics.quantiles(latencies[-max(100, total // 10):], n=100)
+        dups = found + missed
+        self.stdout.write(f"{total} questions in one room ({opts['backend']}), {dups} planted paraphrases")
+        self.stdout.write(
+            f"per question (signature + lookup + insert): p50 {cuts[49] * 1000:.3f} ms, "
+            f"p99 {cuts[98] * 1000:.3f} ms; last 10%: p50 {last[49] * 1000:.3f} ms, p99 {last[98] * 1000:.3f} ms"
+        )
+        self.stdout.write(f"candidates checked per question: {candidates / total:.1f}")
+        self.stdout.write(f"recall {found / max(dups, 1):.1%}, false positives {false_positive / max(total - dups, 1):.2%}")
+        self.stdout.write(f"brute force at {total}: p50 {statistics.median(brute) * 1000:.1f} ms per question")
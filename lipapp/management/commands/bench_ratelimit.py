@@ -0,0 +1,80 @@
+# lipapp/management/commands/bench_ratelimit.py
+import random
+import time
+
+import redis as redis_py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lipapp.services.limiter import FixedWindowLimiter, GCRALimiter, RejectCache
+from lipapp.services.ratelimit import Limit
+
+
+def counting_client(url):
+    """یک کلاینت Redis که تعداد رفت‌وبرگشت‌ها (command یا pipeline) را می‌شمارد."""
+    conn = redis_py.from_url(url, decode_responses=True)
+    conn.round_trips = 0
+
+    execute_command = conn.execute_command
+    def counted(*args, **kwargs):
+        conn.round_trips += 1
+        return execute_command(*args, **kwargs)
+    conn.execute_command = counted
+
+    pipeline = conn.pipeline
+    def counted_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+        def counted_execute(*a, **kw):
+            conn.round_trips += 1
+            return execute(*a, **kw)
+        pipe.execute = counted_execute
+        return pipe
+    conn.pipeline = counted_pipeline
+    return conn
+
+
+class Command(BaseCommand):
+    help = "Compare fixed-window and GCRA rate limiters: ops/sec and Redis round trips per request."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--redis-url", default=settings.REDIS_URL)
+        parser.add_argument("--subjects", type=int, default=500, help="Distinct fingerprints.")
+        parser.add_argument("--requests", type=int, default=20_000)
+        parser.add_argument("--limit", type=int, default=5)
+        parser.add_argument("--window", type=int, default=10)
+        parser.add_argument("--hot", type=float, default=0.8,
+                            help="Share of requests from the 5%% most abusive subjects.")
+
+    def handle(self, *args, **opts):
+        lim = Limit(limit=opts["limit"], window=opts["window"])
+        subjects = [f"bench:{random.getrandbits(64):x}" for _ in range(opts["subjects"])]
+        hot = subjects[: max(1, len(subjects) // 20)]
+        workload = [
+            random.choice(hot) if random.random() < opts["hot"] else random.choice(subjects)
+            for _ in range(opts["requests"])
+        ]
+
+        variants = [
+            ("fixed-window", lambda c: FixedWindowLimiter(conn=c)),
+            ("gcra", lambda c: GCRALimiter(conn=c, reject_cache=RejectCache(size=0))),
+            ("gcra+local", lambda c: GCRALimiter(conn=c)),
+        ]
+        self.stdout.write(f"{len(workload)} requests, {len(subjects)} subjects, limit {lim.limit}/{lim.window}s")
+        self.stdout.write(f"{'limiter':<14}{'ops/sec':>12}{'rtt/req':>10}{'allowed':>10}{'keys':>8}")
+        for name, make in variants:
+            conn = counting_client(opts["redis_url"])
+            limiter = make(conn)
+            prefix = f"bench{random.getrandbits(32):x}"
+            allowed = 0
+            start = time.perf_counter()
+            for subject in workload:
+                ok, _, _ = limiter.allow(f"{prefix}:{subject}", lim)
+                allowed += ok
+            elapsed = time.perf_counter() - start
+            trips = conn.round_trips
+            keys = sum(1 for _ in conn.scan_iter(f"*{prefix}*", count=1000))
+            self.stdout.write(
+                f"{name:<14}{len(workload) / elapsed:>12.0f}"
+                f"{trips / len(workload):>10.2f}{allowed:>10}{keys:>8}"
+            )
@@ -0,0 +1,95 @@
+# lipapp/management/commands/bench_views.py
+import asyncio
+import logging
+import statistics
+import time
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+
+from lipapp import async_views, urls, views
+from lipapp.models import Room, Question, Poll, PollOption
+
+
+def urlconf(fast):
+    """ROOT_URLCONF با viewهای بیننده از ماژول fast (نام routeها همان است، پس {% url %} کار می‌کند)."""
+    class URLConf:
+        urlpatterns = urls.build(fast)
+    return URLConf
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and native async view paths (room_view, question_vote, poll_vote, "
+        "question_create): requests/sec and p50/p99 latency under the same concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2_000, help="Requests per scenario and path.")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--questions", type=int, default=200, help="Approved questions in the bench room.")
+        parser.add_argument("--only", choices=["sync", "async"], help="Run a single path.")
+
+    def handle(self, *args, **opts):
+        room = Room.objects.create(title="bench_views")
+        try:
+            questions = Question.objects.bulk_create(
+                [Question(room=room, body=f"bench {i}", status=Question.STATUS_APPROVED)
+                 for i in range(opts["questions"])]
+            )
+            poll = Poll.objects.create(room=room, question="bench?", is_active=True)
+            options = PollOption.objects.bulk_create([PollOption(poll=poll, label=l) for l in "abcd"])
+            scenarios = [
+                ("room_view", "get", lambda i: f"/r/{room.slug}/", None),
+                ("question_vote", "post",
+                 lambda i: f"/r/{room.slug}/questions/{questions[i % len(questions)].pk}/vote/", None),
+                ("poll_vote", "post",
+                 lambda i: f"/r/{room.slug}/polls/{poll.pk}/vote/{options[i % len(options)].pk}/", None),
+                ("question_create", "post",
+                 lambda i: f"/r/{room.slug}/questions/create/", {"body": "bench question"}),
+            ]
+            paths = [("sync", views), ("async", async_views)]
+            if opts["only"]:
+                paths = [p for p in paths if p[0] == opts["only"]]
+
+            self.stdout.write(
+                f"{opts['requests']} requests per scenario, concurrency {opts['concurrency']}"
+            )
+            self.stdout.write(f"{'scenario':<17}{'path':<7}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+            # 4xx/5xx فقط شمرده می‌شوند (لاگ هر خطا جدول را به هم می‌ریزد)
+            logging.getLogger("django.request").setLevel(logging.CRITICAL)
+            for name, method, url, data in scenarios:
+                for label, fast in paths:
+                    with override_settings(ROOT_URLCONF=urlconf(fast), ALLOWED_HOSTS=["testserver"]):
+                        rps, p50, p99, errors = asyncio.run(
+                            self.run(method, url, data, opts["requests"], opts["concurrency"])
+                        )
+                    self.stdout.write(f"{name:<17}{label:<7}{rps:>9.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}")
+        finally:
+            room.delete()
+
+    async def run(self, method, url, data, total, concurrency):
+        latencies, errors = [], 0
+        counter = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                # کلاینت تازه = بیننده‌ی تازه (cookie lp_vid جدید)، پس rate-limit هر بیننده جلوی بار را نمی‌گیرد
+                client = AsyncClient(raise_request_exception=False)
+                start = time.perf_counter()
+                # مثل ASGIHandler: viewهای sync هر درخواست thread خودشان را دارند
+                async with ThreadSensitiveContext():
+                    if method == "get":
+                        resp = await client.get(url(i))
+                    else:
+                        resp = await client.post(url(i), data or {})
+                latencies.append(time.perf_counter() - start)
+                errors += resp.status_code >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        cuts = statistics.quantiles(latencies, n=100)
+        return total / elapsed, cuts[49] * 1000, cuts[98] * 1000, errors
@@ -0,0 +1,50 @@
+# lipapp/management/commands/flush_questions.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lipapp import views
+from lipapp.realtime import publish_host_now
+from lipapp.services import ingest
+
+
+def notify_hosts(questions):
+    """یک host.row برای هر اتاق با سطرهای pending جدید (فقط پنل‌های میزبان)."""
+    by_room: dict[str, list] = {}
+    for q in questions:
+        by_room.setdefault(q.room.slug, []).append(views.host_row(q))
+    for slug, items in by_room.items():
+        publish_host_now(slug, "host.row", {"items": items})
+
+
+class Command(BaseCommand):
+    help = "Drain queued question submissions into the database in batches (QUESTION_INGEST=redis)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=settings.QUESTION_FLUSH_BATCH)
+        parser.add_argument("--interval", type=float, default=settings.QUESTION_FLUSH_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+
+    def drain(self, batch: int) -> int:
+        total = 0
+        for created in ingest.drain(batch):
+            notify_hosts(created)
+            total += len(created)
+        return total
+
+    def handle(self, *args, **opts):
+        if opts["once"]:
+            n = self.drain(opts["batch"])
+            self.stdout.write(self.style.SUCCESS(f"Flushed {n} questions"))
+            return
+
+        self.stdout.write(f"Flushing questions every {opts['interval']}s (batch={opts['batch']})")
+        while True:
+            try:
+                n = self.drain(opts["batch"])
+                if n:
+                    self.stdout.write(f"Flushed {n} questions")
+            except Exception as e:  # Redis/DB blip: دوباره در دور بعد
+                self.stderr.write(f"flush failed: {e}")
+            time.sleep(opts["interval"])
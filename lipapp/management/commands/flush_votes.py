@@ -0,0 +1,32 @@
+# lipapp/management/commands/flush_votes.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lipapp.services import votes
+
+
+class Command(BaseCommand):
+    help = "Periodically flush Redis-buffered question votes into the database (VOTE_INGEST=redis)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=settings.VOTE_FLUSH_BATCH)
+        parser.add_argument("--interval", type=float, default=settings.VOTE_FLUSH_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+
+    def handle(self, *args, **opts):
+        if opts["once"]:
+            n = votes.flush_all(opts["batch"])
+            self.stdout.write(self.style.SUCCESS(f"Flushed {n} votes"))
+            return
+
+        self.stdout.write(f"Flushing votes every {opts['interval']}s (batch={opts['batch']})")
+        while True:
+            try:
+                n = votes.flush_all(opts["batch"])
+                if n:
+                    self.stdout.write(f"Flushed {n} votes")
+            except Exception as e:  # Redis/DB blip: دوباره در دور بعد
+                self.stderr.write(f"flush failed: {e}")
+            time.sleep(opts["interval"])
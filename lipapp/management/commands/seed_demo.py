@@ -33,5 +33,6 @@ class Command(BaseCommand):
         if not poll.options.exists():
             for o in ["Better moderation", "Emoji reactions", "Embed widget", "Analytics"]:
                 PollOption.objects.create(poll=poll, label=o, votes_cached=random.randint(0, 20))
+            poll.recount_votes()
 
         self.stdout.write(self.style.SUCCESS(f"Demo is ready.\nViewer: /r/{room.slug}/\nHost:   /host/{room.slug}/?host={room.host_secret}"))
@@ -0,0 +1,146 @@
+# lipapp/management/commands/shard_harness.py
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+
+import redis as redis_py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lipapp.services.shards import HashRing, room_route
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_redis(n: int):
+    """n نمونه‌ی redis-server محلی روی پورت‌های آزاد (بدون persistence)."""
+    binary = shutil.which("redis-server")
+    if not binary:
+        raise CommandError("redis-server not found on PATH; pass --nodes instead of --spawn")
+    procs, urls = [], []
+    for _ in range(n):
+        port = _free_port()
+        workdir = tempfile.mkdtemp(prefix="lp-shard-")
+        procs.append(subprocess.Popen(
+            [binary, "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        urls.append(f"redis://127.0.0.1:{port}/0")
+    for url in urls:
+        conn = redis_py.from_url(url)
+        for _ in range(50):
+            try:
+                conn.ping()
+                break
+            except redis_py.ConnectionError:
+                time.sleep(0.1)
+    return procs, urls
+
+
+class Command(BaseCommand):
+    help = "Check room distribution and movement over the Redis shard ring, optionally against live instances."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nodes", default=",".join(settings.REDIS_URLS),
+                            help="Comma-separated Redis URLs (default: REDIS_URLS).")
+        parser.add_argument("--rooms", type=int, default=10_000)
+        parser.add_argument("--spawn", type=int, default=0,
+                            help="Start N local redis-server instances and use them as nodes.")
+        parser.add_argument("--live", action="store_true",
+                            help="Write a probe key per room through the ring and verify placement and failover.")
+
+    def handle(self, *args, **opts):
+        procs = []
+        try:
+            if opts["spawn"]:
+                procs, nodes = spawn_redis(opts["spawn"])
+                opts["live"] = True
+            else:
+                nodes = [n.strip() for n in opts["nodes"].split(",") if n.strip()]
+            slugs = [f"room-{i}" for i in range(opts["rooms"])]
+            ring = HashRing(nodes)
+
+            self.report_distribution(ring, slugs)
+            self.report_movement(ring, slugs)
+            if opts["live"]:
+                self.live_check(ring, slugs, procs)
+        finally:
+            for p in procs:
+                p.kill()
+
+    def placement(self, ring, slugs) -> dict[str, str]:
+        return {slug: ring.node(room_route(slug)) for slug in slugs}
+
+    def report_distribution(self, ring, slugs):
+        counts = {node: 0 for node in ring.nodes}
+        for node in self.placement(ring, slugs).values():
+            counts[node] += 1
+        mean = len(slugs) / len(ring.nodes)
+        self.stdout.write(f"{len(slugs)} rooms over {len(ring.nodes)} shards ({ring.vnodes} vnodes each)")
+        for node, n in counts.items():
+            self.stdout.write(f"  {node:<40}{n:>8}{n / mean:>8.2f}x")
+        if len(counts) > 1:
+            self.stdout.write(f"  stdev {statistics.pstdev(counts.values()) / mean:.1%} of mean")
+
+    def report_movement(self, ring, slugs):
+        before = self.placement(ring, slugs)
+        grown = ring.with_node("redis://new-shard:6379/0")
+        moved = sum(1 for s, n in self.placement(grown, slugs).items() if n != before[s])
+        ideal = 1 / len(grown.nodes)
+        self.stdout.write(f"add 1 shard: {moved / len(slugs):.1%} of rooms move (ideal {ideal:.1%})")
+        for node in ring.nodes if len(ring.nodes) > 1 else ():
+            after = self.placement(ring.without(node), slugs)
+            moved = [s for s, n in after.items() if n != before[s]]
+            stray = sum(1 for s in moved if before[s] != node)
+            self.stdout.write(
+                f"remove {node}: {len(moved) / len(slugs):.1%} move, {stray} from other shards"
+            )
+
+    def live_check(self, ring, slugs, procs):
+        conns = {node: redis_py.from_url(node, decode_responses=True) for node in ring.nodes}
+        placement = self.placement(ring, slugs)
+        for node, conn in conns.items():
+            pipe = conn.pipeline(transaction=False)
+            for slug, owner in placement.items():
+                if owner == node:
+                    pipe.set(f"shardprobe:{slug}", node, ex=300)
+            pipe.execute()
+        misplaced = 0
+        for node, conn in conns.items():
+            for key in conn.scan_iter("shardprobe:*", count=1000):
+                if placement[key.split(":", 1)[1]] != node:
+                    misplaced += 1
+        self.stdout.write(f"live: wrote {len(slugs)} probes, {misplaced} on the wrong shard")
+
+        if not procs or len(procs) < 2:
+            return
+        # failover: یک نمونه را بکش؛ فقط اتاق‌های همان shard باید به shard دیگری بروند
+        dead = ring.nodes[0]
+        procs[0].kill()
+        procs[0].wait()
+        healthy = []
+        for node in ring.nodes:
+            try:
+                conns[node].ping()
+                healthy.append(node)
+            except redis_py.ConnectionError:
+                pass
+        survivor = HashRing(healthy, ring.vnodes)
+        after = self.placement(survivor, slugs)
+        lost = [s for s in slugs if placement[s] == dead]
+        moved_others = sum(1 for s in slugs if placement[s] != dead and after[s] != placement[s])
+        readable = sum(
+            1 for s in slugs if placement[s] != dead and conns[after[s]].exists(f"shardprobe:{s}")
+        )
+        self.stdout.write(
+            f"failover: killed {dead}; {len(lost)} rooms re-home "
+            f"({len(lost) / len(slugs):.1%}), {moved_others} others moved, "
+            f"{readable}/{len(slugs) - len(lost)} surviving probes still readable"
+        )
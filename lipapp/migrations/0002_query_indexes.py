@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lipapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='lipapp_ques_room_id_68f29e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='vote',
+            name='lipapp_vote_questio_7c18fa_idx',
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['room', '-created_at'], name='poll_room_active'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['room', 'status'], name='question_room_status'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['room', 'id'], name='question_room_pending'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lipapp', '0003_poll_total_votes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='ingest_id',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(condition=models.Q(('ingest_id__isnull', False)), fields=('ingest_id',), name='question_ingest_id'),
+        ),
+    ]
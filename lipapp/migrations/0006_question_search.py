@@ -0,0 +1,64 @@
+from django.db import migrations
+
+
+class VendorRunSQL(migrations.RunSQL):
+    """RunSQL فقط روی یک vendor دیتابیس (SQL متن کامل SQLite و PostgreSQL فرق دارد)."""
+
+    def __init__(self, vendor, sql, reverse_sql):
+        self.vendor = vendor
+        super().__init__(sql, reverse_sql)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lipapp', '0005_question_duplicate_of'),
+    ]
+
+    operations = [
+        VendorRunSQL(
+            "sqlite",
+            [
+                """CREATE VIRTUAL TABLE lipapp_question_fts USING fts5(
+                    body, content='lipapp_question', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+                )""",
+                """CREATE TRIGGER lipapp_question_fts_ai AFTER INSERT ON lipapp_question BEGIN
+                    INSERT INTO lipapp_question_fts(rowid, body) VALUES (new.id, new.body);
+                END""",
+                """CREATE TRIGGER lipapp_question_fts_ad AFTER DELETE ON lipapp_question BEGIN
+                    INSERT INTO lipapp_question_fts(lipapp_question_fts, rowid, body) VALUES ('delete', old.id, old.body);
+                END""",
+                """CREATE TRIGGER lipapp_question_fts_au AFTER UPDATE OF body ON lipapp_question BEGIN
+                    INSERT INTO lipapp_question_fts(lipapp_question_fts, rowid, body) VALUES ('delete', old.id, old.body);
+                    INSERT INTO lipapp_question_fts(rowid, body) VALUES (new.id, new.body);
+                END""",
+                "INSERT INTO lipapp_question_fts(lipapp_question_fts) VALUES ('rebuild')",
+            ],
+            [
+                "DROP TRIGGER IF EXISTS lipapp_question_fts_ai",
+                "DROP TRIGGER IF EXISTS lipapp_question_fts_ad",
+                "DROP TRIGGER IF EXISTS lipapp_question_fts_au",
+                "DROP TABLE IF EXISTS lipapp_question_fts",
+            ],
+        ),
+        VendorRunSQL(
+            "postgresql",
+            [
+                """ALTER TABLE lipapp_question ADD COLUMN search_vector tsvector
+                    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(body, ''))) STORED""",
+                "CREATE INDEX question_search ON lipapp_question USING GIN (search_vector)",
+            ],
+            [
+                "DROP INDEX IF EXISTS question_search",
+                "ALTER TABLE lipapp_question DROP COLUMN IF EXISTS search_vector",
+            ],
+        ),
+    ]
@@ -52,6 +52,7 @@ class Question(models.Model):
         (STATUS_REJECTED, "Rejected"),
         (STATUS_ANSWERED, "Answered"),
     ]
+    VISIBLE_STATUSES = (STATUS_APPROVED, STATUS_ANSWERED)  # برای بیننده‌ها
 
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="questions")
     author_name = models.CharField(max_length=60, blank=True, null=True)
@@ -62,12 +63,36 @@ class Question(models.Model):
 
     score_cached = models.IntegerField(default=0)  # مجموع رأی‌ها (کش برای سورت)
 
+    # سوال قبلی تقریباً یکسان در همین اتاق (MinHash/LSH، lipapp.services.dedupe)؛ فقط flag برای میزبان
+    duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, blank=True, null=True, related_name="duplicates"
+    )
+
+    # شناسه‌ی ورودی صف QUESTION_INGEST=redis (lipapp.services.ingest)؛ جلوی درج دوباره‌ی یک batch را می‌گیرد
+    ingest_id = models.CharField(max_length=16, blank=True, null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # هر index یک query داغ (تست‌های EXPLAIN در lipapp/tests.py):
+        #   - room/status: بازسازی leaderboard اتاق (ترتیب در Redis است، نه DB)
+        #   - pending: صف میزبان با keyset روی id؛ partial چون فقط سوال‌های pending را دارد
         indexes = [
-            models.Index(fields=["room", "-score_cached", "created_at"]),
+            models.Index(fields=["room", "status"], name="question_room_status"),
+            models.Index(
+                fields=["room", "id"],
+                name="question_room_pending",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+        constraints = [
+            # partial: فقط سوال‌هایی که از صف آمده‌اند در index هستند
+            models.UniqueConstraint(
+                fields=["ingest_id"],
+                name="question_ingest_id",
+                condition=models.Q(ingest_id__isnull=False),
+            ),
         ]
         ordering = ["-score_cached", "created_at"]
 
@@ -106,10 +131,8 @@ class Vote(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # index یکتای همین جفت برای get_or_create و flush رأی‌ها کافی است
         unique_together = [("question", "voter_key")]
-        indexes = [
-            models.Index(fields=["question", "voter_key"]),
-        ]
 
     def __str__(self):
         return f"Vote q={self.question_id} by {self.voter_key[:8]}…"
@@ -121,17 +144,30 @@ class Poll(models.Model):
     is_active = models.BooleanField(default=True)
     ends_at = models.DateTimeField(blank=True, null=True)
 
+    # مجموع votes_cached گزینه‌ها (denormalized)؛ همراه رأی در همان view زیاد می‌شود
+    # تا admin و پنل میزبان برای هر Poll گزینه‌ها را نخوانند
+    total_votes_cached = models.IntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Poll فعال اتاق (snapshot بیننده و غیرفعال کردن قبلی)
+            models.Index(
+                fields=["room", "-created_at"],
+                name="poll_room_active",
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return f"Poll#{self.pk} in {self.room.slug}"
 
-    @property
-    def total_votes_cached(self):
-        return sum(o.votes_cached for o in self.options.all())
+    def recount_votes(self):
+        """total_votes_cached را از روی گزینه‌ها دوباره حساب می‌کند (بعد از ویرایش دستی در admin)."""
+        self.total_votes_cached = self.options.aggregate(total=models.Sum("votes_cached"))["total"] or 0
+        self.save(update_fields=["total_votes_cached"])
 
 
 class PollOption(models.Model):
@@ -1,16 +1,208 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+"""
+ارسال eventهای اتاق به WebSocketها از طریق یک outbox.
+
+viewها فقط event را ثبت می‌کنند (transaction.on_commit)؛ انتشار واقعی در یک
+publisher پس‌زمینه‌ی asyncio (thread جدا در همان پروسه‌ی ASGI) انجام می‌شود:
+  - صف محدود (BROADCAST_QUEUE_SIZE)؛ اگر پر شد event دور ریخته و شمرده می‌شود
+  - batch در پنجره‌ی BROADCAST_COALESCE_MS؛ tallyها برای هر id فقط آخرین وضعیت را نگه می‌دارند
+  - retry با backoff روی خطای Redis
+هر event یک بار به JSON تبدیل، با seq در لاگ اتاق ثبت و روی کانال room:<slug> منتشر می‌شود
+(lipapp.services.eventlog و lipapp.hub). eventهای میزبان (broadcast_host) فقط روی host:<slug>
+منتشر می‌شوند و در لاگ اتاق نمی‌روند (سوال‌های pending نباید به بیننده‌ها برسند).
+پس latency درخواست HTTP فقط زمان DB است و eventی از تراکنش rollback‌شده منتشر نمی‌شود.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .hub import channel, host_channel
+from .services.eventlog import EventLog, frame_parts
+from .services import shards
+from .services.shards import AsyncClients
+
+logger = logging.getLogger(__name__)
+
 
 def broadcast_room(slug: str, event: str, payload: dict):
     """
-    ارسال یک پیام به همه‌ی کلاینت‌های اتاق.
-    event مثل "question.new" یا "vote.tally"
-    payload هر چیزی می‌تونه باشه (معمولاً {html: "", id: ...})
-    """
-    layer = get_channel_layer()
-    if not layer:
-        return
-    async_to_sync(layer.group_send)(
-        f"room_{slug}",
-        {"type": "dispatch", "event": event, "payload": payload or {}},
-    )
+    ارسال یک پیام به همه‌ی کلاینت‌های اتاق (بعد از commit تراکنش جاری).
+    event مثل "question.new" یا "question.update"
+    payload هر چیزی می‌تونه باشه (معمولاً {html: "", id: ...} یا یک delta)
+    """
+    transaction.on_commit(lambda: publisher().enqueue(slug, event, payload or {}))
+
+
+def broadcast_tally(slug: str, event: str, item_id, payload: dict):
+    """
+    مثل broadcast_room ولی ادغام‌شده: برای هر آیتم فقط آخرین وضعیت در هر پنجره ارسال می‌شود.
+    کلاینت event را با payload = {"items": [payload, ...]} دریافت می‌کند.
+    """
+    transaction.on_commit(lambda: publisher().enqueue(slug, event, payload, key=item_id))
+
+
+def broadcast_host(slug: str, event: str, payload: dict):
+    """فقط برای socketهای میزبان اتاق (ws/host/<slug>/)، بدون seq و لاگ؛ بعد از commit."""
+    transaction.on_commit(lambda: publisher().enqueue(slug, event, payload or {}, host=True))
+
+
+def publish(slug: str, event: str, payload: dict, key=None, host: bool = False):
+    """
+    بدون on_commit، برای viewهای async (lipapp.async_views): نوشتن‌های async ORM
+    در autocommit قبل از برگشتن await خودشان commit شده‌اند.
+    enqueue فقط call_soon_threadsafe است و event loop درخواست را block نمی‌کند.
+    """
+    publisher().enqueue(slug, event, payload or {}, key=key, host=host)
+
+
+def publish_host_now(slug: str, event: str, payload: dict):
+    """
+    PUBLISH مستقیم و sync روی host:<slug>، برای workerهای بیرون از ASGI (flush_questions)
+    که publisher پس‌زمینه لازم ندارند؛ eventهای میزبان seq و لاگ ندارند.
+    """
+    shards.room(slug).publish(host_channel(slug), "".join(frame_parts(event, payload or {})))
+
+
+class Publisher:
+    def __init__(self, window: float, max_queue: int = 10_000, max_batch: int = 1_000, retries: int = 3):
+        self.window = window
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.retries = retries
+        self._loop = None
+        self._queue = None
+        self._redis = AsyncClients()
+        self._logs: dict[str, EventLog] = {}   # shard url -> EventLog
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self.enqueued = 0   # eventهای ثبت‌شده
+        self.sent = 0       # پیام‌های منتشرشده روی Redis
+        self.merged = 0     # tallyهایی که با نسخه‌ی جدیدتر همان id جایگزین شدند
+        self.dropped = 0    # صف پر بود
+        self.failed = 0     # بعد از همه‌ی retryها ارسال نشد
+        self.retried = 0
+
+    # ---------- thread-safe API ----------
+
+    def enqueue(self, slug: str, event: str, payload: dict, key=None, host: bool = False):
+        self._ensure_started()
+        self._loop.call_soon_threadsafe(self._put, (slug, event, key, payload, host))
+
+    def stats(self) -> dict:
+        depth = self._queue.qsize() if self._queue else 0
+        return {
+            "window_ms": int(self.window * 1000),
+            "queue_depth": depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "merged": self.merged,
+            # پیام‌هایی که با ادغام صرفه‌جویی شد؛ dropped هیچ‌وقت در enqueued نبوده
+            # (تا ارسال batch در جریان کمی بیشتر نشان می‌دهد، هیچ‌وقت منفی نه)
+            "saved": self.enqueued - self.sent - self.failed - depth,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    # ---------- loop ----------
+
+    def _ensure_started(self):
+        if self._started.is_set():
+            return
+        with self._start_lock:
+            if self._started.is_set():
+                return
+            threading.Thread(target=self._thread_main, name="broadcast-publisher", daemon=True).start()
+            self._started.wait()
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._started.set()
+        self._loop.run_until_complete(self._run())
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            for slug, event, payload, host in self._coalesce(batch):
+                await self._send(slug, event, payload, host)
+
+    def _coalesce(self, batch):
+        """
+        eventهای بدون key به همان ترتیب می‌مانند؛ eventهای key‌دار (tally) برای هر
+        (اتاق، event) در یک پیام {"items": [...]} با آخرین وضعیت هر key جمع می‌شوند.
+        """
+        slots = []
+        tallies: dict[tuple, dict] = {}
+        for slug, event, key, payload, host in batch:
+            if key is None:
+                slots.append((slug, event, payload, host))
+                continue
+            group = tallies.get((slug, event))
+            if group is None:
+                group = tallies[(slug, event)] = {}
+                slots.append((slug, event, group, host))
+            if key in group:
+                self.merged += 1
+            group[key] = payload
+        for slug, event, payload, host in slots:
+            if (slug, event) in tallies and payload is tallies[(slug, event)]:
+                yield slug, event, {"items": list(payload.values())}, host
+            else:
+                yield slug, event, payload, host
+
+    async def _send(self, slug: str, event: str, payload: dict, host: bool = False):
+        url = self._redis.url(slug)
+        log = self._logs.get(url)
+        if log is None:
+            log = self._logs[url] = EventLog(self._redis.get(url))
+        # encode-once: همین frame (با seq) بدون تغییر در لاگ و روی همه‌ی socketها نوشته می‌شود
+        for attempt in range(self.retries + 1):
+            try:
+                if host:
+                    await log.conn.publish(host_channel(slug), "".join(frame_parts(event, payload)))
+                else:
+                    await log.append(slug, event, payload, channel(slug))
+                self.sent += 1
+                return
+            except Exception:
+                if attempt == self.retries:
+                    self.failed += 1
+                    logger.exception("broadcast to room %s failed", slug)
+                    return
+                self.retried += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def publisher() -> Publisher:
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = Publisher(
+                    window=getattr(settings, "BROADCAST_COALESCE_MS", 150) / 1000,
+                    max_queue=getattr(settings, "BROADCAST_QUEUE_SIZE", 10_000),
+                )
+    return _publisher
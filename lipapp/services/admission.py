@@ -0,0 +1,233 @@
+# lipapp/services/admission.py
+"""
+پذیرش رأی سوال در یک رفت‌وبرگشت به Redis.
+
+یک Lua script به صورت اتمیک این‌ها را چک می‌کند:
+  1. rate-limit (همان GCRA سرویس limiter، با pre-check محلی کلیدهای رد‌شده)
+  2. قفل debounce کوتاه برای هر سوال/کاربر
+  3. رأی تکراری (set voterهای سوال)
+در حالت VOTE_INGEST=redis اگر رأی پذیرفته شد voter، امتیاز و صف write-behind در همان
+script ثبت می‌شوند. در حالت db فقط عضویت چک می‌شود و view بعد از commit رأی در دیتابیس
+voter را با remember_vote ثبت می‌کند؛ پس نوشتن ناموفق (مثلاً lock دیتابیس) رأی را
+برای همیشه "تکراری" نمی‌کند و کاربر می‌تواند دوباره امتحان کند.
+LocalAdmission همان منطق را در حافظه‌ی پروسه پیاده می‌کند (برای تست و dev تک‌پروسه‌ای).
+admit_vote_async همان call روی redis.asyncio است (lipapp.async_views).
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+
+from .limiter import GCRA_LUA, LocalGCRA, RejectCache
+from .ratelimit import Limit
+from . import shards, votes
+
+OK = "ok"
+RATE_LIMITED = "rate_limited"
+DEBOUNCED = "debounced"
+DUPLICATE = "duplicate"
+
+LOCK_TTL = 1  # ثانیه
+
+# KEYS: gcra, lock, voters, score, queue
+# ARGV: limit, window, lock_ttl, voter, record(0/1), seed_score, queue_entry, state_ttl
+# خروجی: {status, remaining, score(-1 = نامشخص), reset_ms}
+_ADMIT_LUA = GCRA_LUA + """
+if allowed == 0 then
+  return {'rate_limited', 0, -1, math.ceil(retry_ms)}
+end
+local reset = math.ceil(reset_ms)
+if not redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[3]) then
+  return {'debounced', remaining, -1, reset}
+end
+if ARGV[5] ~= '1' then
+  if redis.call('SISMEMBER', KEYS[3], ARGV[4]) == 1 then
+    return {'duplicate', remaining, -1, reset}
+  end
+  return {'ok', remaining, -1, reset}
+end
+if redis.call('SADD', KEYS[3], ARGV[4]) == 0 then
+  return {'duplicate', remaining, tonumber(redis.call('GET', KEYS[4]) or -1), reset}
+end
+redis.call('EXPIRE', KEYS[3], ARGV[8])
+redis.call('SET', KEYS[4], ARGV[6], 'NX')
+redis.call('EXPIRE', KEYS[4], ARGV[8])
+redis.call('RPUSH', KEYS[5], ARGV[7])
+return {'ok', remaining, redis.call('INCR', KEYS[4]), reset}
+"""
+
+
+@dataclass
+class Verdict:
+    status: str                  # ok | rate_limited | debounced | duplicate
+    limit: Limit
+    remaining: int
+    reset: int
+    score: Optional[int] = None  # امتیاز زنده (فقط وقتی record=True)
+
+    @property
+    def allowed(self) -> bool:
+        return self.status == OK
+
+
+def _verdict(status, remaining, score, reset_ms, limit: Limit) -> Verdict:
+    score = int(score)
+    return Verdict(
+        status=status,
+        limit=limit,
+        remaining=int(remaining),
+        reset=max(0, math.ceil(int(reset_ms) / 1000)),
+        score=score if score >= 0 else None,
+    )
+
+
+class RedisAdmission:
+    def __init__(self, conn=None):
+        self._conn = conn
+        self._script = None
+        self._async_script = None
+        self.rejects = RejectCache()
+
+    def admit(self, slug: str, rl_key: str, lock_key: str, question, voter: str, limit: Limit, record: bool = False) -> Verdict:
+        # over-limit قطعی: بدون رفتن به Redis
+        left = self.rejects.blocked_for(rl_key)
+        if left:
+            return _verdict(RATE_LIMITED, 0, -1, left * 1000, limit)
+
+        # همه‌ی کلیدهای script (gcra، lock، رأی‌ها، صف) روی shard همان اتاق هستند
+        conn = self._conn or shards.room(slug)
+        if self._script is None:
+            self._script = conn.register_script(_ADMIT_LUA)
+        result = self._script(**self._call(rl_key, lock_key, question, voter, limit, record), client=conn)
+        return self._result(rl_key, limit, *result)
+
+    async def admit_async(self, slug: str, rl_key: str, lock_key: str, question, voter: str, limit: Limit, record: bool = False) -> Verdict:
+        left = self.rejects.blocked_for(rl_key)
+        if left:
+            return _verdict(RATE_LIMITED, 0, -1, left * 1000, limit)
+
+        conn = shards.room_async(slug)
+        if self._async_script is None:
+            self._async_script = conn.register_script(_ADMIT_LUA)
+        result = await self._async_script(**self._call(rl_key, lock_key, question, voter, limit, record), client=conn)
+        return self._result(rl_key, limit, *result)
+
+    def remember(self, slug: str, question, voter: str):
+        conn = self._conn or shards.room(slug)
+        pipe = conn.pipeline(transaction=False)
+        pipe.sadd(votes.voters_key(question.pk), voter)
+        pipe.expire(votes.voters_key(question.pk), votes.STATE_TTL)
+        pipe.execute()
+
+    async def remember_async(self, slug: str, question, voter: str):
+        pipe = shards.room_async(slug).pipeline(transaction=False)
+        pipe.sadd(votes.voters_key(question.pk), voter)
+        pipe.expire(votes.voters_key(question.pk), votes.STATE_TTL)
+        await pipe.execute()
+
+    def _call(self, rl_key, lock_key, question, voter, limit, record) -> dict:
+        return {
+            "keys": [
+                f"gcra:{rl_key}",
+                lock_key,
+                votes.voters_key(question.pk),
+                votes.score_key(question.pk),
+                votes.QUEUE_KEY,
+            ],
+            "args": [
+                limit.limit, limit.window, LOCK_TTL, voter,
+                "1" if record else "0", question.score_cached, f"{question.pk}|{voter}", votes.STATE_TTL,
+            ],
+        }
+
+    def _result(self, rl_key, limit, status, remaining, score, reset_ms) -> Verdict:
+        if status == RATE_LIMITED:
+            self.rejects.block(rl_key, int(reset_ms) / 1000)
+        return _verdict(status, remaining, score, reset_ms, limit)
+
+
+class LocalAdmission:
+    """معادل درون‌پروسه‌ای RedisAdmission (بدون TTL دقیق برای set/score)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.gcra = LocalGCRA()
+        self.locks: dict[str, float] = {}
+        self.voters: dict[int, set] = {}
+        self.scores: dict[int, int] = {}
+        self.queue: list[str] = []
+
+    def admit(self, slug: str, rl_key: str, lock_key: str, question, voter: str, limit: Limit, record: bool = False) -> Verdict:
+        allowed, remaining, retry_ms, reset_ms = self.gcra.check(rl_key, limit)
+        if not allowed:
+            return _verdict(RATE_LIMITED, 0, -1, retry_ms, limit)
+        now = time.monotonic()
+        with self._lock:
+            if self.locks.get(lock_key, 0) > now:
+                return _verdict(DEBOUNCED, remaining, -1, reset_ms, limit)
+            self.locks[lock_key] = now + LOCK_TTL
+            voters = self.voters.setdefault(question.pk, set())
+            if not record:
+                return _verdict(DUPLICATE if voter in voters else OK, remaining, -1, reset_ms, limit)
+            if voter in voters:
+                return _verdict(DUPLICATE, remaining, self.scores.get(question.pk, -1), reset_ms, limit)
+            voters.add(voter)
+            self.scores[question.pk] = self.scores.get(question.pk, question.score_cached) + 1
+            self.queue.append(f"{question.pk}|{voter}")
+            return _verdict(OK, remaining, self.scores[question.pk], reset_ms, limit)
+
+    async def admit_async(self, *args, **kwargs) -> Verdict:
+        return self.admit(*args, **kwargs)
+
+    def remember(self, slug: str, question, voter: str):
+        with self._lock:
+            self.voters.setdefault(question.pk, set()).add(voter)
+
+    async def remember_async(self, slug: str, question, voter: str):
+        self.remember(slug, question, voter)
+
+
+_backend = None
+
+def backend():
+    """VOTE_ADMISSION_BACKEND: "redis" (پیش‌فرض) یا "local" (فقط تک‌پروسه/تست)."""
+    global _backend
+    if _backend is None:
+        if getattr(settings, "VOTE_ADMISSION_BACKEND", "redis") == "local":
+            _backend = LocalAdmission()
+        else:
+            _backend = RedisAdmission()
+    return _backend
+
+
+def _vote_call(slug: str, question, fp: str, voter: str, limit: Limit) -> dict:
+    return {
+        "slug": slug,
+        "rl_key": f"q:vote:{slug}:{fp}",
+        "lock_key": f"lock:vote:{slug}:{question.pk}:{fp}",
+        "question": question,
+        "voter": voter,
+        "limit": limit,
+        "record": votes.enabled(),
+    }
+
+
+def admit_vote(slug: str, question, fp: str, voter: str, limit: Limit) -> Verdict:
+    """رأی سوال: rate-limit + debounce + تکراری، در یک call."""
+    return backend().admit(**_vote_call(slug, question, fp, voter, limit))
+
+
+async def admit_vote_async(slug: str, question, fp: str, voter: str, limit: Limit) -> Verdict:
+    return await backend().admit_async(**_vote_call(slug, question, fp, voter, limit))
+
+
+def remember_vote(slug: str, question, voter: str):
+    """حالت db: بعد از commit رأی در دیتابیس، voter برای چک تکراری در set ثبت می‌شود."""
+    backend().remember(slug, question, voter)
+
+
+async def remember_vote_async(slug: str, question, voter: str):
+    await backend().remember_async(slug, question, voter)
@@ -0,0 +1,289 @@
+# lipapp/services/dedupe.py
+"""
+تشخیص سوال‌های تقریباً تکراری با MinHash + LSH برای هر اتاق (QUESTION_DEDUPE).
+
+  - signature: ‏64 مقدار MinHash ‏16بیتی روی shingleهای متن (کلمه‌ها و جفت‌کلمه‌های پشت‌سرهم)؛
+    هر shingle یک بار با shake_128 هش می‌شود و min ستونی در C گرفته می‌شود (~0.1ms برای یک سوال)
+  - LSH: ‏16 band ‏4تایی؛ دو سوال با Jaccard حدود 0.5 به بالا به احتمال زیاد در یک band هم‌سطل‌اند
+  - کاندیدها (حداکثر MAX_CANDIDATES) با شباهت تخمینی signature چک می‌شوند و بهترینِ بالای
+    QUESTION_DEDUPE_THRESHOLD برگردانده می‌شود
+
+هزینه‌ی هر سوال مستقل از اندازه‌ی اتاق است: به‌جای مقایسه با همه، فقط سطل‌های 16 band خوانده می‌شوند.
+RedisLSH روی shard اتاق دو hash دارد (dedupe:bands:<slug> و dedupe:sigs:<slug>)؛ جست‌وجو و
+درج هر کدام یک Lua script (یک رفت‌وبرگشت). LocalLSH همان index در حافظه‌ی پروسه است
+(برای تست، dev تک‌پروسه‌ای و bench_dedupe).
+"""
+import base64
+import hashlib
+import re
+import struct
+import threading
+from array import array
+
+from django.conf import settings
+
+from . import shards
+
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+MAX_CANDIDATES = 64   # سقف کاندیدهای هر جست‌وجو
+BUCKET_SIZE = 32      # هر سطل فقط آخرین idها را نگه می‌دارد (bandهای خیلی رایج مثل "what is")
+STATE_TTL = 7 * 24 * 3600
+
+_WORD = re.compile(r"\w+")
+_SIG = struct.Struct(f"<{PERMUTATIONS}H")
+
+
+def enabled() -> bool:
+    return getattr(settings, "QUESTION_DEDUPE", True)
+
+
+def threshold() -> float:
+    return getattr(settings, "QUESTION_DEDUPE_THRESHOLD", 0.6)
+
+
+def shingles(text: str) -> set[str]:
+    words = _WORD.findall(text.lower())
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def signature(text: str) -> tuple[int, ...] | None:
+    """MinHash متن؛ None برای متن بدون کلمه."""
+    rows = [array("H", hashlib.shake_128(s.encode()).digest(2 * PERMUTATIONS)) for s in shingles(text)]
+    if not rows:
+        return None
+    return tuple(map(min, zip(*rows)))
+
+
+def similarity(a, b) -> float:
+    """Jaccard تخمینی دو signature (سهم مقادیر برابر)."""
+    return sum(x == y for x, y in zip(a, b)) / PERMUTATIONS
+
+
+def bands(sig) -> list[str]:
+    """کلید سطل هر band: "<band>:<مقادیر hex>"."""
+    return [
+        f"{i}:" + "".join(f"{v:04x}" for v in sig[i * ROWS:(i + 1) * ROWS])
+        for i in range(BANDS)
+    ]
+
+
+def encode(sig) -> str:
+    return base64.b64encode(_SIG.pack(*sig)).decode()
+
+
+def decode(raw: str) -> tuple[int, ...]:
+    return _SIG.unpack(base64.b64decode(raw))
+
+
+def best_match(sig, candidates) -> int | None:
+    """candidates: [(id, signature)]؛ شبیه‌ترین بالای threshold (در تساوی، قدیمی‌تر)."""
+    best, best_score = None, threshold()
+    for qid, other in sorted(candidates):
+        score = similarity(sig, other)
+        if score >= best_score and (best is None or score > best_score):
+            best, best_score = qid, score
+    return best
+
+
+def bands_key(slug: str) -> str:
+    return f"dedupe:bands:{slug}"
+
+
+def sigs_key(slug: str) -> str:
+    return f"dedupe:sigs:{slug}"
+
+
+# KEYS: bands, sigs   ARGV: max_candidates, band fields...
+# خروجی: {id, sig, id, sig, ...} (جدیدترین idهای هر سطل اول)
+_FIND_LUA = """
+local buckets = redis.call('HMGET', KEYS[1], unpack(ARGV, 2))
+local seen, ids = {}, {}
+local limit = tonumber(ARGV[1])
+for _, bucket in ipairs(buckets) do
+  if bucket then
+    local found = {}
+    for id in string.gmatch(bucket, '%d+') do table.insert(found, id) end
+    for i = #found, 1, -1 do
+      local id = found[i]
+      if not seen[id] and #ids < limit then
+        seen[id] = true
+        table.insert(ids, id)
+      end
+    end
+  end
+end
+if #ids == 0 then return {} end
+local sigs = redis.call('HMGET', KEYS[2], unpack(ids))
+local out = {}
+for i, id in ipairs(ids) do
+  if sigs[i] then
+    table.insert(out, id)
+    table.insert(out, sigs[i])
+  end
+end
+return out
+"""
+
+# KEYS: bands, sigs   ARGV: id, sig, bucket_size, ttl, band fields...
+_ADD_LUA = """
+local size = tonumber(ARGV[3])
+for i = 5, #ARGV do
+  local bucket = redis.call('HGET', KEYS[1], ARGV[i])
+  if bucket then
+    local _, n = string.gsub(bucket, ' ', '')
+    if n + 1 >= size then
+      bucket = string.sub(bucket, string.find(bucket, ' ') + 1)
+    end
+    bucket = bucket .. ' ' .. ARGV[1]
+  else
+    bucket = ARGV[1]
+  end
+  redis.call('HSET', KEYS[1], ARGV[i], bucket)
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RedisLSH:
+    def __init__(self, conn=None):
+        self._conn = conn   # فقط برای bench_dedupe/تست؛ در حالت عادی shard اتاق
+        self._find = self._add = None
+        self._find_async = self._add_async = None
+
+    def find(self, slug: str, sig) -> list[tuple[int, tuple]]:
+        conn = self._conn or shards.room(slug)
+        if self._find is None:
+            self._find = conn.register_script(_FIND_LUA)
+        flat = self._find(
+            keys=[bands_key(slug), sigs_key(slug)], args=[MAX_CANDIDATES, *bands(sig)], client=conn
+        )
+        return _candidates(flat)
+
+    def add(self, slug: str, qid: int, sig):
+        conn = self._conn or shards.room(slug)
+        if self._add is None:
+            self._add = conn.register_script(_ADD_LUA)
+        self._add(keys=[bands_key(slug), sigs_key(slug)], args=_add_args(qid, sig), client=conn)
+
+    async def find_async(self, slug: str, sig) -> list[tuple[int, tuple]]:
+        conn = shards.room_async(slug)
+        if self._find_async is None:
+            self._find_async = conn.register_script(_FIND_LUA)
+        flat = await self._find_async(
+            keys=[bands_key(slug), sigs_key(slug)], args=[MAX_CANDIDATES, *bands(sig)], client=conn
+        )
+        return _candidates(flat)
+
+    async def add_async(self, slug: str, qid: int, sig):
+        conn = shards.room_async(slug)
+        if self._add_async is None:
+            self._add_async = conn.register_script(_ADD_LUA)
+        await self._add_async(keys=[bands_key(slug), sigs_key(slug)], args=_add_args(qid, sig), client=conn)
+
+
+def _candidates(flat) -> list[tuple[int, tuple]]:
+    return [(int(flat[i]), decode(flat[i + 1])) for i in range(0, len(flat), 2)]
+
+
+def _add_args(qid: int, sig) -> list:
+    return [qid, encode(sig), BUCKET_SIZE, STATE_TTL, *bands(sig)]
+
+
+class LocalLSH:
+    """معادل درون‌پروسه‌ای RedisLSH (بدون TTL)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets: dict[str, dict[str, list[int]]] = {}
+        self.sigs: dict[str, dict[int, tuple]] = {}
+
+    def find(self, slug: str, sig) -> list[tuple[int, tuple]]:
+        with self._lock:
+            buckets, sigs = self.buckets.get(slug, {}), self.sigs.get(slug, {})
+            ids = []
+            for field in bands(sig):
+                for qid in reversed(buckets.get(field, ())):
+                    if qid not in ids and len(ids) < MAX_CANDIDATES:
+                        ids.append(qid)
+            return [(qid, sigs[qid]) for qid in ids if qid in sigs]
+
+    def add(self, slug: str, qid: int, sig):
+        with self._lock:
+            buckets = self.buckets.setdefault(slug, {})
+            for field in bands(sig):
+                bucket = buckets.setdefault(field, [])
+                bucket.append(qid)
+                del bucket[:-BUCKET_SIZE]
+            self.sigs.setdefault(slug, {})[qid] = tuple(sig)
+
+    async def find_async(self, slug: str, sig):
+        return self.find(slug, sig)
+
+    async def add_async(self, slug: str, qid: int, sig):
+        self.add(slug, qid, sig)
+
+
+_backend = None
+
+def backend():
+    """QUESTION_DEDUPE_BACKEND: "redis" (پیش‌فرض) یا "local" (فقط تک‌پروسه/تست)."""
+    global _backend
+    if _backend is None:
+        if getattr(settings, "QUESTION_DEDUPE_BACKEND", "redis") == "local":
+            _backend = LocalLSH()
+        else:
+            _backend = RedisLSH()
+    return _backend
+
+
+def match(slug: str, text: str):
+    """
+    قبل از ساخت سوال: (signature، id سوال تکراری یا None).
+    signature بعد از ساخت به add داده می‌شود؛ با QUESTION_DEDUPE خاموش (None, None).
+    """
+    if not enabled():
+        return None, None
+    sig = signature(text)
+    if sig is None:
+        return None, None
+    return sig, best_match(sig, backend().find(slug, sig))
+
+
+def add(slug: str, qid: int, sig):
+    if sig is not None:
+        backend().add(slug, qid, sig)
+
+
+async def match_async(slug: str, text: str):
+    if not enabled():
+        return None, None
+    sig = signature(text)
+    if sig is None:
+        return None, None
+    return sig, best_match(sig, await backend().find_async(slug, sig))
+
+
+async def add_async(slug: str, qid: int, sig):
+    if sig is not None:
+        await backend().add_async(slug, qid, sig)
+
+
+def flag(questions) -> list:
+    """
+    برای سوال‌هایی که قبلاً ساخته شده‌اند (batchهای ingest): به ترتیب match و add،
+    پس تکراری‌های داخل همان batch هم پیدا می‌شوند. سوال‌های flag‌شده را برمی‌گرداند
+    (duplicate_of_id ست شده؛ ذخیره با bulk_update توسط صدا‌زننده).
+    """
+    flagged = []
+    for q in questions:
+        sig, dup = match(q.room.slug, q.body)
+        if dup is not None and dup != q.pk:
+            q.duplicate_of_id = dup
+            flagged.append(q)
+        add(q.room.slug, q.pk, sig)
+    return flagged
@@ -0,0 +1,92 @@
+# lipapp/services/eventlog.py
+"""
+لاگ ترتیب‌دار eventهای اتاق برای replay بعد از reconnect.
+
+هر event اتاق یک seq یکنوا می‌گیرد (room:seq:<slug>) و frame نهایی (همان JSON که
+روی WebSocket می‌رود، با فیلد seq) در یک Redis stream محدود (room:log:<slug>) با
+ID برابر seq ذخیره می‌شود. INCR + XADD + PUBLISH در یک Lua script اتمیک است،
+پس ترتیب لاگ و ترتیب انتشار یکی است.
+
+کلاینتی که با ?since=<seq> وصل می‌شود فقط deltaهای بعد از آن را می‌گیرد؛ اگر آن بازه
+دیگر در لاگ نیست (trim شده یا seq از نو شروع شده) جواب None است = snapshot لازم است.
+"""
+import json
+
+from django.conf import settings
+
+from . import shards
+
+_APPEND_LUA = """
+-- KEYS[1] = seq، KEYS[2] = stream
+-- ARGV: channel، head، tail، maxlen، ttl
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  -- seq منقضی شده: لاگ قدیمی هم دیگر معتبر نیست
+  redis.call('DEL', KEYS[2])
+end
+local seq = redis.call('INCR', KEYS[1])
+local frame = ARGV[2] .. ',"seq":' .. seq .. ARGV[3]
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[4], seq .. '-0', 'f', frame)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('PUBLISH', ARGV[1], frame)
+return seq
+"""
+
+
+def seq_key(slug: str) -> str:
+    return f"room:seq:{slug}"
+
+
+def log_key(slug: str) -> str:
+    return f"room:log:{slug}"
+
+
+def current_seq(slug: str) -> int:
+    """آخرین seq اتاق (sync؛ برای room_view قبل از ساختن snapshot)."""
+    return int(shards.room(slug).get(seq_key(slug)) or 0)
+
+
+def frame_parts(event: str, payload: dict) -> tuple[str, str]:
+    """
+    frame را دو تکه می‌کند تا Lua بتواند seq را بعد از event بگذارد:
+    {"event":"vote.tally" + ,"seq":N + ,"items":[...]}
+    """
+    head = '{"event":' + json.dumps(event)
+    body = json.dumps(payload, separators=(",", ":")) if payload else "{}"
+    tail = "}" if body == "{}" else "," + body[1:]
+    return head, tail
+
+
+class EventLog:
+    """روی یک کلاینت redis.asyncio (هر event loop کلاینت خودش را دارد)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.maxlen = getattr(settings, "ROOM_LOG_SIZE", 500)
+        self.ttl = getattr(settings, "ROOM_LOG_TTL", 24 * 3600)
+        self._append = conn.register_script(_APPEND_LUA)
+
+    async def append(self, slug: str, event: str, payload: dict, channel: str) -> int:
+        head, tail = frame_parts(event, payload)
+        seq = await self._append(
+            keys=[seq_key(slug), log_key(slug)],
+            args=[channel, head, tail, self.maxlen, self.ttl],
+            client=self.conn,
+        )
+        return int(seq)
+
+    async def replay(self, slug: str, since: int) -> tuple[int, list[str] | None]:
+        """
+        برمی‌گرداند: (seq فعلی، frameهای بعد از since به ترتیب)
+        frameها None است اگر بازه‌ی since+1..seq کامل در لاگ نیست.
+        """
+        pipe = self.conn.pipeline(transaction=True)
+        pipe.get(seq_key(slug))
+        pipe.xrange(log_key(slug), min=f"{since + 1}-0", max="+", count=self.maxlen * 2)
+        current, entries = await pipe.execute()
+        current = int(current or 0)
+        if since == current:
+            return current, []
+        if since > current or not entries or int(entries[0][0].split("-")[0]) != since + 1:
+            return current, None
+        return current, [fields["f"] for _, fields in entries]
@@ -0,0 +1,100 @@
+# lipapp/services/identity.py
+"""
+هویت stateless بیننده و میزبان با cookieهای امضاشده (بدون سشن دیتابیسی).
+
+  - lp_vid: شناسه‌ی تصادفی بیننده؛ یک بار ساخته و با signing جنگو امضا می‌شود.
+    fingerprint و voter_key از همین ساخته می‌شوند، پس رأی دادن هیچ INSERT سشنی ندارد.
+  - lp_host: لیست slug اتاق‌هایی که این مرورگر میزبانشان است (بعد از ?host=<secret>).
+
+چک کردن امضا فقط HMAC است و به دیتابیس یا Redis نیاز ندارد.
+"""
+import secrets
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core import signing
+from django.http.cookie import parse_cookie
+
+VOTER_COOKIE = "lp_vid"
+HOST_COOKIE = "lp_host"
+SALT = "lipapp.identity"
+MAX_AGE = 365 * 24 * 3600
+
+
+def _signer(key: str):
+    return signing.get_cookie_signer(salt=f"{SALT}:{key}")
+
+
+def _unsign(cookies, key: str):
+    value = cookies.get(key)
+    if not value:
+        return None
+    try:
+        return _signer(key).unsign(value, max_age=MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def voter_id_from_cookies(cookies) -> str | None:
+    return _unsign(cookies, VOTER_COOKIE)
+
+
+def host_rooms_from_cookies(cookies) -> set[str]:
+    raw = _unsign(cookies, HOST_COOKIE)
+    return set(raw.split(",")) if raw else set()
+
+
+def scope_cookies(scope) -> dict:
+    """cookieهای handshake یک WebSocket (scope در ASGI) برای consumerها."""
+    for name, value in scope.get("headers", ()):
+        if name == b"cookie":
+            return parse_cookie(value.decode("latin-1"))
+    return {}
+
+
+def grant_host(request, slug: str):
+    """اتاق را به cookie میزبان اضافه می‌کند (middleware آن را روی response می‌نویسد)."""
+    request.host_rooms.add(slug)
+    request._identity_dirty = True
+
+
+class VoterIdentityMiddleware:
+    """
+    request.voter_id و request.host_rooms را از cookieهای امضاشده پر می‌کند
+    و اگر بیننده شناسه نداشت یکی می‌سازد.
+    هم sync و هم async است تا زنجیره‌ی middleware زیر ASGI برای viewهای async
+    (lipapp.async_views) thread عوض نکند.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._load(request)
+        return self._store(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        self._load(request)
+        return self._store(request, await self.get_response(request))
+
+    def _load(self, request):
+        voter_id = voter_id_from_cookies(request.COOKIES)
+        request._voter_minted = voter_id is None
+        request.voter_id = voter_id or secrets.token_urlsafe(16)
+        request.host_rooms = host_rooms_from_cookies(request.COOKIES)
+        request._identity_dirty = False
+
+    def _store(self, request, response):
+        opts = {"max_age": MAX_AGE, "httponly": True, "samesite": "Lax", "secure": request.is_secure()}
+        if request._voter_minted:
+            response.set_cookie(VOTER_COOKIE, _signer(VOTER_COOKIE).sign(request.voter_id), **opts)
+        if request._identity_dirty:
+            rooms = ",".join(sorted(request.host_rooms))
+            response.set_cookie(HOST_COOKIE, _signer(HOST_COOKIE).sign(rooms), **opts)
+        return response
@@ -0,0 +1,130 @@
+# lipapp/services/ingest.py
+"""
+صف ورودی سوال‌ها (QUESTION_INGEST="redis").
+
+question_create بعد از rate-limit و اعتبارسنجی فقط یک XADD روی stream روی shard اتاق
+(questions:ingest) می‌زند و بلافاصله ack برمی‌گرداند؛ نوشتنی روی دیتابیس در مسیر درخواست نیست.
+`manage.py flush_questions` صف را batch به batch با یک bulk_create می‌نویسد، تکراری‌ها را
+flag می‌کند (lipapp.services.dedupe) و پنل‌های میزبان را با host.row خبر می‌کند.
+
+اگر worker عقب بماند (یا اجرا نشود) stream بی‌نهایت بزرگ نمی‌شود: از QUESTION_INGEST_MAX_BACKLOG
+ورودی به بعد submit با Backlogged رد می‌شود (503) به‌جای اینکه سوال‌های flush‌نشده trim شوند.
+
+هر ورودی یک ingest_id یکتا دارد (Question.ingest_id). stream فقط بعد از commit پاک می‌شود
+و ingest_idهای از قبل نوشته‌شده دوباره ساخته نمی‌شوند؛ پس اگر worker وسط کار بمیرد
+همان batch بدون سوال تکراری دوباره پردازش می‌شود. برای هر shard فقط یک worker اجرا کنید.
+"""
+import logging
+import secrets
+
+from django.conf import settings
+from django.db import transaction
+
+from . import dedupe, shards
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "questions:ingest"
+
+# KEYS: stream   ARGV: max_backlog, id, room, body, author
+# خروجی: 1 = صف شد، 0 = صف پر است
+_SUBMIT_LUA = """
+if redis.call('XLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('XADD', KEYS[1], '*', 'id', ARGV[2], 'room', ARGV[3], 'body', ARGV[4], 'author', ARGV[5])
+return 1
+"""
+
+_script = None
+_async_script = None
+
+
+class Backlogged(Exception):
+    """صف ورودی این shard پر است (flush_questions عقب است یا اجرا نمی‌شود)."""
+
+
+def enabled() -> bool:
+    return getattr(settings, "QUESTION_INGEST", "db") == "redis"
+
+
+def max_backlog() -> int:
+    return getattr(settings, "QUESTION_INGEST_MAX_BACKLOG", 100_000)
+
+
+def _args(room, body: str, author: str | None) -> list:
+    return [max_backlog(), secrets.token_hex(8), room.pk, body, author or ""]
+
+
+def submit(room, body: str, author: str | None = None, conn=None) -> str:
+    """سوال را در صف می‌گذارد (یک XADD شرطی) و ingest_id آن را برمی‌گرداند؛ صف پر: Backlogged."""
+    global _script
+    conn = conn or shards.room(room.slug)
+    if _script is None:
+        _script = conn.register_script(_SUBMIT_LUA)
+    args = _args(room, body, author)
+    if not _script(keys=[STREAM_KEY], args=args, client=conn):
+        raise Backlogged(STREAM_KEY)
+    return args[1]
+
+
+async def submit_async(room, body: str, author: str | None = None) -> str:
+    global _async_script
+    conn = shards.room_async(room.slug)
+    if _async_script is None:
+        _async_script = conn.register_script(_SUBMIT_LUA)
+    args = _args(room, body, author)
+    if not await _async_script(keys=[STREAM_KEY], args=args, client=conn):
+        raise Backlogged(STREAM_KEY)
+    return args[1]
+
+
+def flush(batch_size: int = 500, conn=None) -> list:
+    """
+    یک batch از stream را در دیتابیس می‌نویسد و سوال‌های ساخته‌شده را برمی‌گرداند
+    (با room، برای رندر سطر پنل میزبان). ورودی‌های اتاق‌های حذف‌شده دور ریخته می‌شوند.
+    """
+    from ..models import Question, Room
+
+    conn = conn or shards.default()
+    entries = conn.xrange(STREAM_KEY, count=batch_size)
+    if not entries:
+        return []
+
+    rows = {}
+    for _, fields in entries:
+        ingest_id, room_id, body = fields.get("id"), fields.get("room", ""), fields.get("body")
+        if ingest_id and room_id.isdigit() and body:
+            rows[ingest_id] = (int(room_id), body, fields.get("author") or None)
+
+    with transaction.atomic():
+        rooms = Room.objects.in_bulk({room_id for room_id, _, _ in rows.values()})
+        done = set(Question.objects.filter(ingest_id__in=rows).values_list("ingest_id", flat=True))
+        created = Question.objects.bulk_create(
+            [
+                Question(room=rooms[room_id], body=body, author_name=author, ingest_id=ingest_id)
+                for ingest_id, (room_id, body, author) in rows.items()
+                if room_id in rooms and ingest_id not in done
+            ]
+        )
+
+    conn.xdel(STREAM_KEY, *[entry_id for entry_id, _ in entries])
+    # تکراری‌ها (با هم و با index اتاق) بعد از درج، چون index به id سوال نیاز دارد؛
+    # سوال‌ها دیگر در دیتابیس هستند، پس خطای dedupe نباید جلوی خبر دادن به میزبان را بگیرد
+    try:
+        flagged = dedupe.flag(created)
+        if flagged:
+            Question.objects.bulk_update(flagged, ["duplicate_of"])
+    except Exception:
+        logger.warning("dedupe for %d ingested questions failed", len(created), exc_info=True)
+    return created
+
+
+def drain(batch_size: int = 500, conn=None):
+    """
+    batch به batch تا خالی شدن stream؛ هر batch (لیست سوال‌های ساخته‌شده) yield می‌شود
+    تا میزبان‌ها زیر بار ممتد هم بعد از هر batch خبردار شوند. بدون conn همه‌ی shardها.
+    """
+    for conn in [conn] if conn is not None else shards.all_clients():
+        while conn.xlen(STREAM_KEY):
+            yield flush(batch_size, conn=conn)
@@ -0,0 +1,133 @@
+# lipapp/services/leaderboard.py
+"""
+ایندکس رتبه‌بندی سوال‌های قابل‌مشاهده‌ی هر اتاق در Redis.
+
+ترتیب همان ترتیب room_view است: pinned اول (جدیدترین pin اول)، بعد امتیاز بیشتر،
+بعد سوال قدیمی‌تر. دو sorted set برای هر اتاق:
+  - lb:<slug>:pinned  با score = زمان pin
+  - lb:<slug>:ranked  با score = امتیاز * 2^32 + (2^32 - 1 - id)
+امتیاز ترکیبی یکتاست و برای keyset pagination به‌عنوان cursor استفاده می‌شود
+(دقیق تا ~2M رأی برای هر سوال).
+ایندکس با رأی/pin/تغییر وضعیت به‌روز می‌شود و اگر وجود نداشت از DB ساخته می‌شود.
+"""
+from . import shards
+
+SHIFT = 2 ** 32
+BUILT_TTL = 3600  # هر ساعت یک بار از DB بازسازی می‌شود (تغییرات admin و ...)
+
+
+def pinned_key(slug: str) -> str:
+    return f"lb:{slug}:pinned"
+
+
+def ranked_key(slug: str) -> str:
+    return f"lb:{slug}:ranked"
+
+
+def built_key(slug: str) -> str:
+    return f"lb:{slug}:built"
+
+
+def composite(score: int, question_id: int) -> int:
+    return score * SHIFT + (SHIFT - 1 - question_id)
+
+
+def rebuild(room, conn=None):
+    """ساخت کامل ایندکس اتاق از DB (یک query، یک MULTI)."""
+    from ..models import Question
+
+    conn = conn or shards.room(room.slug)
+    # بدون ORDER BY (ترتیب را sorted set می‌سازد) تا index (room, status) کافی باشد
+    rows = room.questions.filter(
+        status__in=Question.VISIBLE_STATUSES
+    ).order_by().values_list("id", "score_cached", "pinned_at")
+    pinned, ranked = {}, {}
+    for qid, score, pinned_at in rows:
+        if pinned_at:
+            pinned[qid] = pinned_at.timestamp()
+        else:
+            ranked[qid] = composite(score, qid)
+
+    pipe = conn.pipeline()
+    pipe.delete(pinned_key(room.slug), ranked_key(room.slug))
+    if pinned:
+        pipe.zadd(pinned_key(room.slug), pinned)
+    if ranked:
+        pipe.zadd(ranked_key(room.slug), ranked)
+    pipe.set(built_key(room.slug), "1", ex=BUILT_TTL)
+    pipe.execute()
+
+
+def ensure(room, conn=None):
+    conn = conn or shards.room(room.slug)
+    if not conn.exists(built_key(room.slug)):
+        rebuild(room, conn=conn)
+
+
+def upsert(slug: str, q, conn=None):
+    """وضعیت فعلی یک سوال (امتیاز/pin/status) را در ایندکس می‌نویسد."""
+    upsert_many(slug, [q], conn=conn)
+
+
+def upsert_many(slug: str, questions, conn=None):
+    """مثل upsert برای چند سوال یک اتاق، در یک pipeline (moderation گروهی)."""
+    conn = conn or shards.room(slug)
+    pipe = conn.pipeline()
+    for q in questions:
+        pipe.zrem(pinned_key(slug), q.pk)
+        pipe.zrem(ranked_key(slug), q.pk)
+        if q.status in q.VISIBLE_STATUSES:
+            if q.pinned_at:
+                pipe.zadd(pinned_key(slug), {q.pk: q.pinned_at.timestamp()})
+            else:
+                pipe.zadd(ranked_key(slug), {q.pk: composite(q.score_cached, q.pk)})
+    pipe.execute()
+
+
+def set_score(slug: str, q, conn=None):
+    """فقط امتیاز؛ اگر سوال در ranked نیست (pinned/pending) کاری نمی‌کند."""
+    conn = conn or shards.room(slug)
+    conn.zadd(ranked_key(slug), {q.pk: composite(q.score_cached, q.pk)}, xx=True)
+
+
+async def set_score_async(slug: str, q, conn=None):
+    conn = conn or shards.room_async(slug)
+    await conn.zadd(ranked_key(slug), {q.pk: composite(q.score_cached, q.pk)}, xx=True)
+
+
+def remove(slug: str, question_ids, conn=None):
+    ids = list(question_ids)
+    if not ids:
+        return
+    conn = conn or shards.room(slug)
+    pipe = conn.pipeline()
+    pipe.zrem(pinned_key(slug), *ids)
+    pipe.zrem(ranked_key(slug), *ids)
+    pipe.execute()
+
+
+def page(room, cursor: str | None = None, limit: int = 30, conn=None):
+    """
+    یک صفحه از ایندکس.
+    صفحه‌ی اول (cursor=None) همه‌ی pinnedها + limit تای اول ranked را دارد.
+    برمی‌گرداند: ([(question_id, score یا None), ...], next_cursor یا None)
+    score برای pinnedها None است (از DB خوانده شود).
+    """
+    conn = conn or shards.room(room.slug)
+    ensure(room, conn=conn)
+
+    items = []
+    if cursor is None:
+        items += [(int(m), None) for m in conn.zrevrange(pinned_key(room.slug), 0, -1)]
+        upper = "+inf"
+    else:
+        upper = f"({int(cursor)}"
+
+    rows = conn.zrevrangebyscore(
+        ranked_key(room.slug), upper, "-inf", start=0, num=limit + 1, withscores=True
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items += [(int(m), int(sc) // SHIFT) for m, sc in rows]
+    next_cursor = str(int(rows[-1][1])) if more else None
+    return items, next_cursor
@@ -0,0 +1,209 @@
+# lipapp/services/limiter.py
+"""
+Rate-limiterهای قابل تعویض پشت services.ratelimit.allow.
+
+  - FixedWindowLimiter: الگوریتم قدیمی (هر پنجره یک کلید جدید، burst دوبرابر در مرز پنجره)
+  - GCRALimiter: GCRA / token bucket؛ یک کلید برای هر subject (فقط TAT)،
+    burst حداکثر = limit، و یک LRU محلی از کلیدهای رد‌شده تا کلاینتی که
+    قطعاً هنوز over-limit است اصلاً به Redis نرسد.
+
+هر دو همان امضای allow(key, Limit) -> (allowed, remaining, reset_seconds) را دارند
+و allow_async همان را روی redis.asyncio (برای viewهای async) انجام می‌دهد.
+RATELIMIT_BACKEND در settings انتخاب می‌کند ("gcra" یا "fixed").
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import shards
+
+# بدنه‌ی مشترک GCRA برای Lua (در admission هم استفاده می‌شود)
+# ورودی: KEYS[1] = کلید TAT، ARGV[1] = limit، ARGV[2] = window (ثانیه)
+# خروجی: localهای allowed(0/1)، remaining، retry_ms، reset_ms
+GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local burst = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2]) * 1000 / burst
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - burst * interval
+local allowed, remaining, retry_ms, reset_ms
+if allow_at > now then
+  allowed, remaining, retry_ms, reset_ms = 0, 0, allow_at - now, tat - now
+else
+  redis.call('SET', KEYS[1], string.format('%.0f', math.ceil(new_tat)), 'PX', math.ceil(new_tat - now))
+  allowed, remaining, retry_ms, reset_ms = 1, math.floor((now - allow_at) / interval), 0, new_tat - now
+end
+"""
+
+_GCRA_ALLOW_LUA = GCRA_LUA + """
+return {allowed, remaining, math.ceil(retry_ms), math.ceil(reset_ms)}
+"""
+
+
+def _seconds(ms) -> int:
+    return max(0, math.ceil(int(ms) / 1000))
+
+
+class RejectCache:
+    """
+    LRU کوچک درون‌پروسه‌ای: key -> زمانی (monotonic) که زودتر از آن قطعاً رد می‌شود.
+    رد شدن در GCRA وضعیت Redis را تغییر نمی‌دهد، پس رد محلی تا retry_after دقیقاً همان نتیجه است.
+    """
+
+    def __init__(self, size: int = 10_000):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+
+    def blocked_for(self, key: str) -> float:
+        with self._lock:
+            until = self._data.get(key)
+            if until is None:
+                return 0.0
+            left = until - time.monotonic()
+            if left <= 0:
+                del self._data[key]
+                return 0.0
+            self._data.move_to_end(key)
+            self.hits += 1
+            return left
+
+    def block(self, key: str, seconds: float):
+        with self._lock:
+            self._data[key] = time.monotonic() + seconds
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class FixedWindowLimiter:
+    """
+    الگوریتم Fixed Window ساده:
+    - key: مثلا "q:create:<room_slug>:<fp>" یا "q:vote:<question_id>:<fp>"
+    - برمی‌گرداند: (allowed, remaining, reset_seconds)
+    """
+
+    def __init__(self, conn=None):
+        self._conn = conn
+
+    def allow(self, key: str, limit) -> tuple[bool, int, int]:
+        now = int(time.time())
+        bucket = now // limit.window
+        redis_key = f"rl:{key}:{bucket}"
+        pipe = (self._conn or shards.key(key)).pipeline()
+        pipe.incr(redis_key)
+        pipe.expire(redis_key, limit.window + 2)
+        count, _ = pipe.execute()
+        return self._result(count, now, bucket, limit)
+
+    async def allow_async(self, key: str, limit) -> tuple[bool, int, int]:
+        now = int(time.time())
+        bucket = now // limit.window
+        redis_key = f"rl:{key}:{bucket}"
+        pipe = shards.key_async(key).pipeline()
+        pipe.incr(redis_key)
+        pipe.expire(redis_key, limit.window + 2)
+        count, _ = await pipe.execute()
+        return self._result(count, now, bucket, limit)
+
+    def _result(self, count, now: int, bucket: int, limit) -> tuple[bool, int, int]:
+        remaining = max(0, limit.limit - int(count))
+        reset = ((bucket + 1) * limit.window) - now
+        return (count <= limit.limit, remaining, reset)
+
+
+class GCRALimiter:
+    """GCRA با یک کلید gcra:<key> برای هر subject و pre-check محلی."""
+
+    def __init__(self, conn=None, reject_cache: RejectCache | None = None):
+        self._conn = conn
+        self._script = None
+        self._async_script = None
+        self.rejects = reject_cache if reject_cache is not None else RejectCache()
+
+    def allow(self, key: str, limit) -> tuple[bool, int, int]:
+        left = self.rejects.blocked_for(key)
+        if left:
+            return (False, 0, math.ceil(left))
+
+        conn = self._conn or shards.key(key)
+        if self._script is None:
+            self._script = conn.register_script(_GCRA_ALLOW_LUA)
+        allowed, remaining, retry_ms, reset_ms = self._script(
+            keys=[f"gcra:{key}"], args=[limit.limit, limit.window], client=conn
+        )
+        return self._result(key, allowed, remaining, retry_ms, reset_ms)
+
+    async def allow_async(self, key: str, limit) -> tuple[bool, int, int]:
+        left = self.rejects.blocked_for(key)
+        if left:
+            return (False, 0, math.ceil(left))
+
+        # کلاینت async به loop جاری بسته است؛ script (SHA) مشترک و client در هر call
+        conn = shards.key_async(key)
+        if self._async_script is None:
+            self._async_script = conn.register_script(_GCRA_ALLOW_LUA)
+        allowed, remaining, retry_ms, reset_ms = await self._async_script(
+            keys=[f"gcra:{key}"], args=[limit.limit, limit.window], client=conn
+        )
+        return self._result(key, allowed, remaining, retry_ms, reset_ms)
+
+    def _result(self, key: str, allowed, remaining, retry_ms, reset_ms) -> tuple[bool, int, int]:
+        if not allowed:
+            self.rejects.block(key, int(retry_ms) / 1000)
+            return (False, 0, _seconds(retry_ms))
+        return (True, int(remaining), _seconds(reset_ms))
+
+
+class LocalGCRA:
+    """همان GCRA در حافظه‌ی پروسه (برای LocalAdmission و benchmark بدون Redis)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tat: dict[str, float] = {}
+
+    def check(self, key: str, limit) -> tuple[bool, int, int, int]:
+        """برمی‌گرداند: (allowed, remaining, retry_ms, reset_ms)"""
+        now = time.time() * 1000
+        interval = limit.window * 1000 / limit.limit
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            new_tat = tat + interval
+            allow_at = new_tat - limit.limit * interval
+            if allow_at > now:
+                return (False, 0, math.ceil(allow_at - now), math.ceil(tat - now))
+            self._tat[key] = new_tat
+            if len(self._tat) > 100_000:
+                self._tat = {k: v for k, v in self._tat.items() if v > now}
+            return (True, math.floor((now - allow_at) / interval), 0, math.ceil(new_tat - now))
+
+    def allow(self, key: str, limit) -> tuple[bool, int, int]:
+        allowed, remaining, retry_ms, reset_ms = self.check(key, limit)
+        return (allowed, remaining, _seconds(reset_ms if allowed else retry_ms))
+
+    async def allow_async(self, key: str, limit) -> tuple[bool, int, int]:
+        return self.allow(key, limit)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if getattr(settings, "RATELIMIT_BACKEND", "gcra") == "fixed":
+                    _limiter = FixedWindowLimiter()
+                else:
+                    _limiter = GCRALimiter(
+                        reject_cache=RejectCache(getattr(settings, "RATELIMIT_REJECT_CACHE_SIZE", 10_000))
+                    )
+    return _limiter
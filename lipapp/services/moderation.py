@@ -0,0 +1,118 @@
+# lipapp/services/moderation.py
+"""
+moderation گروهی سوال‌ها (پنل میزبان و actionهای admin).
+
+هر عملیات روی هر تعداد سوال یک SELECT ... FOR UPDATE (فقط سطرهایی که واقعاً عوض
+می‌شوند) و یک UPDATE ... WHERE id IN است؛ بعد ایندکس leaderboard هر اتاق در یک pipeline
+و نسخه‌ی snapshot هر اتاق یک بار به‌روز می‌شود. broadcast با viewهاست
+(lipapp.views.broadcast_moderation) تا HTML کارت‌ها همان‌جا رندر شود.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import leaderboard, snapshot
+
+MAX_BATCH = 500  # سقف سوال‌ها در یک apply (و در یک درخواست host_bulk)
+
+
+def _actions(now):
+    """action -> (مقادیر UPDATE، شرط سطرهایی که از قبل همین وضعیت را دارند)"""
+    from ..models import Question
+
+    return {
+        "approve": ({"status": Question.STATUS_APPROVED}, Q(status=Question.STATUS_APPROVED)),
+        "reject": ({"status": Question.STATUS_REJECTED}, Q(status=Question.STATUS_REJECTED)),
+        "answer": ({"status": Question.STATUS_ANSWERED}, Q(status=Question.STATUS_ANSWERED)),
+        "pin": ({"pinned_at": now}, Q(pinned_at__isnull=False)),
+        "unpin": ({"pinned_at": None}, Q(pinned_at__isnull=True)),
+    }
+
+
+ACTIONS = tuple(_actions(None))
+
+
+def list_of(status: str) -> str | None:
+    """لیست پنل میزبان برای یک status (rejected در هیچ لیستی نیست)."""
+    from ..models import Question
+
+    if status == Question.STATUS_PENDING:
+        return "pending"
+    if status in Question.VISIBLE_STATUSES:
+        return "approved"
+    return None
+
+
+@dataclass
+class Change:
+    question: object
+    before: str | None   # status قبل از عملیات؛ None = سوال تازه (Quick add)
+
+    @property
+    def was_visible(self) -> bool:
+        return self.before in self.question.VISIBLE_STATUSES
+
+    @property
+    def is_visible(self) -> bool:
+        return self.question.status in self.question.VISIBLE_STATUSES
+
+    @property
+    def list_before(self) -> str | None:
+        return list_of(self.before)
+
+    @property
+    def list_after(self) -> str | None:
+        return list_of(self.question.status)
+
+
+def apply(questions, action: str) -> list[Change]:
+    """
+    action را روی queryset سوال‌ها اعمال می‌کند و فقط سطرهای تغییرکرده را برمی‌گرداند
+    (question با مقادیر جدید + status قبلی). questions می‌تواند چند اتاق را پوشش دهد.
+    حداکثر MAX_BATCH سطر (به ترتیب pk) در یک تراکنش؛ برای انتخاب‌های بزرگ‌تر batches.
+    """
+    from ..models import Question
+
+    now = timezone.now()
+    values, unchanged = _actions(now)[action]
+    with transaction.atomic():
+        rows = list(
+            questions.exclude(unchanged)
+            .select_related("room")
+            .select_for_update(of=("self",))
+            .order_by("pk")[:MAX_BATCH]
+        )
+        if not rows:
+            return []
+        Question.objects.filter(pk__in=[q.pk for q in rows]).update(**values, updated_at=now)
+
+    changes = []
+    for q in rows:
+        changes.append(Change(q, q.status))
+        for field, value in values.items():
+            setattr(q, field, value)
+        q.updated_at = now
+
+    by_room: dict[str, list[Change]] = {}
+    for change in changes:
+        by_room.setdefault(change.question.room.slug, []).append(change)
+    for slug, room_changes in by_room.items():
+        leaderboard.upsert_many(slug, [c.question for c in room_changes])
+        # فقط وقتی چیزی در صفحه‌ی بیننده عوض شده (رد کردن pendingها نه)
+        if any(c.was_visible or c.is_visible for c in room_changes):
+            snapshot.bump(slug)
+    return changes
+
+
+def batches(questions, action: str):
+    """
+    apply پشت‌سرهم تا وقتی سطری عوض نشود (مثلاً "Select all" در admin)؛ تغییرات هر batch
+    yield می‌شوند تا صدا‌زننده همان batch را broadcast کند. هر batch تراکنش خودش را دارد.
+    """
+    while True:
+        changes = apply(questions, action)
+        if not changes:
+            return
+        yield changes
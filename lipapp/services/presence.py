@@ -0,0 +1,59 @@
+# lipapp/services/presence.py
+"""
+شمارش بیننده‌های زنده با HyperLogLog (حافظه‌ی ثابت برای هر اتاق، بدون نوشتن در DB).
+
+هر پروسه هر INTERVAL ثانیه شناسه‌ی بیننده‌های محلی هر اتاق را با یک pipeline در
+presence:<slug>:<minute> (PFADD) می‌نویسد. تعداد = PFCOUNT روی دقیقه‌ی جاری و قبلی؛
+پروسه‌ای که crash کند دیگر heartbeat نمی‌دهد و بیننده‌هایش حداکثر بعد از دو دقیقه
+از شمارش خارج می‌شوند (بر خلاف INCR/DECR که drift می‌کند).
+
+برای push به میزبان‌ها در هر بازه فقط یک پروسه (با SET NX) شمارش را منتشر می‌کند.
+"""
+import time
+
+BUCKET_SECONDS = 60
+KEY_TTL = 3 * BUCKET_SECONDS
+
+
+def bucket(now: float | None = None) -> int:
+    return int((now if now is not None else time.time()) // BUCKET_SECONDS)
+
+
+def key(slug: str, minute: int) -> str:
+    return f"presence:{slug}:{minute}"
+
+
+def lock_key(slug: str) -> str:
+    return f"presence:push:{slug}"
+
+
+async def heartbeat(conn, rooms: dict[str, set[str]]):
+    """rooms: slug -> شناسه‌های بیننده‌های محلی؛ یک رفت‌وبرگشت برای همه‌ی اتاق‌ها."""
+    if not rooms:
+        return
+    minute = bucket()
+    pipe = conn.pipeline(transaction=False)
+    for slug, ids in rooms.items():
+        if ids:
+            pipe.pfadd(key(slug, minute), *ids)
+            pipe.expire(key(slug, minute), KEY_TTL)
+    await pipe.execute()
+
+
+async def counts(conn, slugs) -> dict[str, int]:
+    minute = bucket()
+    slugs = list(slugs)
+    pipe = conn.pipeline(transaction=False)
+    for slug in slugs:
+        pipe.pfcount(key(slug, minute), key(slug, minute - 1))
+    return {slug: int(n) for slug, n in zip(slugs, await pipe.execute())}
+
+
+async def claim(conn, slugs, interval: float) -> list[str]:
+    """اتاق‌هایی که این پروسه در این بازه مسئول push شمارششان به میزبان‌هاست (SET NX)."""
+    slugs = list(slugs)
+    ttl = max(1, int(interval * 1000) - 50)
+    pipe = conn.pipeline(transaction=False)
+    for slug in slugs:
+        pipe.set(lock_key(slug), "1", nx=True, px=ttl)
+    return [slug for slug, ok in zip(slugs, await pipe.execute()) if ok]
@@ -1,19 +1,14 @@
 # lipapp/services/ratelimit.py
-import os, time, hashlib
+import hashlib
 from dataclasses import dataclass
 from typing import Optional
-import redis as redis_py
-
-REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
-_r = None
-def r():
-    global _r
-    if _r is None:
-        _r = redis_py.from_url(REDIS_URL, decode_responses=True)
-    return _r
 
 def fingerprint(request) -> str:
-    # کلید یکتا برای کاربر ناشناس
+    # کلید یکتا برای کاربر ناشناس: شناسه‌ی امضاشده‌ی lp_vid (VoterIdentityMiddleware)
+    voter_id = getattr(request, "voter_id", None)
+    if voter_id:
+        return voter_id
+    # fallback بدون middleware: سشن + IP + UA
     if not request.session.session_key:
         request.session.save()
     raw = f"{request.session.session_key}|{request.META.get('REMOTE_ADDR')}|{request.META.get('HTTP_USER_AGENT')}"
@@ -26,20 +21,17 @@ class Limit:
 
 def allow(key: str, limit: Limit) -> tuple[bool, int, int]:
     """
-    الگوریتم Fixed Window ساده:
     - key: مثلا "q:create:<room_slug>:<fp>" یا "q:vote:<question_id>:<fp>"
     - برمی‌گرداند: (allowed, remaining, reset_seconds)
+    الگوریتم با RATELIMIT_BACKEND انتخاب می‌شود (GCRA پیش‌فرض؛ services.limiter).
     """
-    now = int(time.time())
-    bucket = now // limit.window
-    redis_key = f"rl:{key}:{bucket}"
-    pipe = r().pipeline()
-    pipe.incr(redis_key)
-    pipe.expire(redis_key, limit.window + 2)
-    count, _ = pipe.execute()
-    remaining = max(0, limit.limit - int(count))
-    reset = ((bucket + 1) * limit.window) - now
-    return (count <= limit.limit, remaining, reset)
+    from . import limiter
+    return limiter.get().allow(key, limit)
+
+async def allow_async(key: str, limit: Limit) -> tuple[bool, int, int]:
+    """همان allow روی redis.asyncio (برای viewهای async)."""
+    from . import limiter
+    return await limiter.get().allow_async(key, limit)
 
 def set_rate_headers(response, remaining: int, reset: int, limit: Limit):
     response["X-RateLimit-Limit"] = str(limit.limit)
@@ -0,0 +1,102 @@
+# lipapp/services/redis_clients.py
+"""
+کلاینت‌های مشترک Redis (sync و asyncio) با pool اندازه‌دار.
+
+  - sync: یک BlockingConnectionPool برای هر shard، مشترک بین همه‌ی threadهای پروسه
+    (viewهای sync در thread-pool ASGI، flusher، ...). اگر pool پر باشد درخواست تا
+    REDIS_POOL_TIMEOUT منتظر می‌ماند و بعد خطا می‌دهد؛ اتصال بی‌حد ساخته نمی‌شود.
+  - asyncio: pool اتصال‌ها به event loop بسته‌اند، پس برای هر (shard، loop) یک pool
+    جدا ساخته می‌شود (loop اصلی ASGI، loop پس‌زمینه‌ی publisher).
+
+همه‌ی کلاینت‌ها timeout اتصال/socket و health check دوره‌ای (PING روی اتصال بیکار) دارند.
+stats() مصرف poolها را برای /metrics برمی‌گرداند.
+"""
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import redis as redis_py
+import redis.asyncio as redis_async
+from django.conf import settings
+
+_lock = threading.Lock()
+_sync: dict[str, redis_py.Redis] = {}
+_async: dict[tuple[str, int], tuple[asyncio.AbstractEventLoop, redis_async.Redis]] = {}
+
+
+def _options() -> dict:
+    return {
+        "decode_responses": True,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def label(url: str) -> str:
+    """host:port/db بدون رمز عبور (برای metrics و لاگ)."""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 6379}{parts.path or '/0'}"
+
+
+def sync_client(url: str) -> redis_py.Redis:
+    conn = _sync.get(url)
+    if conn is None:
+        with _lock:
+            conn = _sync.get(url)
+            if conn is None:
+                pool = redis_py.BlockingConnectionPool.from_url(
+                    url,
+                    max_connections=settings.REDIS_POOL_SIZE,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
+                    **_options(),
+                )
+                conn = _sync[url] = redis_py.Redis(connection_pool=pool)
+    return conn
+
+
+def async_client(url: str) -> redis_async.Redis:
+    """کلاینت asyncio برای event loop جاری (باید داخل یک coroutine صدا زده شود)."""
+    loop = asyncio.get_running_loop()
+    key = (url, id(loop))
+    entry = _async.get(key)
+    if entry is None or entry[0] is not loop:
+        with _lock:
+            # id یک loop بسته‌شده ممکن است دوباره استفاده شود
+            for stale in [k for k, (l, _) in _async.items() if l.is_closed()]:
+                del _async[stale]
+            pool = redis_async.BlockingConnectionPool.from_url(
+                url,
+                max_connections=settings.REDIS_ASYNC_POOL_SIZE,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                **_options(),
+            )
+            entry = _async[key] = (loop, redis_async.Redis(connection_pool=pool))
+    return entry[1]
+
+
+def _sync_usage(pool) -> dict:
+    idle = sum(1 for c in list(pool.pool.queue) if c is not None)
+    created = len(pool._connections)
+    return {"max": pool.max_connections, "created": created, "in_use": created - idle, "idle": idle}
+
+
+def _async_usage(pool) -> dict:
+    idle = len(pool._available_connections)
+    in_use = len(pool._in_use_connections)
+    return {"max": pool.max_connections, "created": idle + in_use, "in_use": in_use, "idle": idle}
+
+
+def stats() -> dict:
+    out = {"sync": {}, "async": {}}
+    for url, conn in list(_sync.items()):
+        out["sync"][label(url)] = _sync_usage(conn.connection_pool)
+    for (url, _), (loop, conn) in list(_async.items()):
+        if loop.is_closed():
+            continue
+        usage = _async_usage(conn.connection_pool)
+        total = out["async"].setdefault(label(url), {"loops": 0, "max": 0, "created": 0, "in_use": 0, "idle": 0})
+        total["loops"] += 1
+        for k, v in usage.items():
+            total[k] += v
+    return out
@@ -0,0 +1,128 @@
+# lipapp/services/search.py
+"""
+جست‌وجوی متن کامل سوال‌ها با index واقعی دیتابیس (پنل میزبان و admin).
+
+  - SQLite: جدول FTS5 با external content (lipapp_question_fts) که با triggerهای
+    insert/update/delete روی lipapp_question به‌روز می‌ماند؛ رتبه با bm25
+  - PostgreSQL: ستون generated از نوع tsvector (search_vector) با index GIN؛ رتبه با ts_rank
+  - بقیه: icontains (بدون index)
+
+هر دو با tokenizer ساده (بدون stemming، برای فارسی و انگلیسی) و تطبیق پیشوندی
+هر کلمه‌ی جست‌وجو ("pric" → pricing) کار می‌کنند؛ کلمه‌ها با AND ترکیب می‌شوند.
+index با همان INSERT/UPDATE سوال در همان تراکنش به‌روز می‌شود (موقع ساخت، ویرایش و حذف).
+schema را migration 0006 (با SQL خودش) می‌سازد و بعد از هر migrate دوباره چک می‌شود (ensure)،
+چون بازسازی جدول در migrationهای بعدی SQLite triggerها را پاک می‌کند.
+مسیر PostgreSQL هنوز آزمایشی است (در این repo فقط روی SQLite تست می‌شود).
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+MAX_TERMS = 8
+
+_WORD = re.compile(r"\w+")
+
+FTS_TABLE = "lipapp_question_fts"
+
+_SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON lipapp_question BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+    END""",
+    f"{FTS_TABLE}_ad": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON lipapp_question BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    f"{FTS_TABLE}_au": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF body ON lipapp_question BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);
+    END""",
+}
+
+
+def repair(connection):
+    """
+    SQLite: اگر جدول FTS هست (migration 0006 اجرا شده) ولی triggerی گم شده، triggerها
+    دوباره ساخته و index از روی جدول بازسازی می‌شود. PostgreSQL (ستون generated) تعمیر لازم ندارد.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = 'lipapp_question')",
+            [FTS_TABLE],
+        )
+        found = {name for (name,) in cursor.fetchall()}
+        if FTS_TABLE not in found or set(_SQLITE_TRIGGERS) <= found:
+            return
+        for statement in _SQLITE_TRIGGERS.values():
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ensure(using="default", **kwargs):
+    """post_migrate: triggerهایی که با بازسازی جدول در migrationهای SQLite پاک شده‌اند برمی‌گردند."""
+    repair(connections[using])
+
+
+def terms(query: str) -> list[str]:
+    return _WORD.findall(query.lower())[:MAX_TERMS]
+
+
+def _match(vendor: str, words: list[str]) -> str:
+    """عبارت MATCH/tsquery؛ کلمه‌ها فقط \\w هستند پس چیزی از syntax جست‌وجو نشت نمی‌کند."""
+    if vendor == "sqlite":
+        return " ".join(f'"{w}"*' for w in words)
+    return " & ".join(f"{w}:*" for w in words)
+
+
+def ranked(room, query: str, limit: int = 20) -> list:
+    """
+    سوال‌های اتاق (به‌جز rejected) به ترتیب ارتباط با query، حداکثر limit تا.
+    index فقط سطرهای دارای همه‌ی کلمه‌ها را می‌دهد؛ هزینه با تعداد تطبیق‌ها است نه اندازه‌ی اتاق.
+    """
+    from ..models import Question
+
+    words = terms(query)
+    if not words:
+        return []
+    connection = connections[Question.objects.db]
+    if connection.vendor == "sqlite":
+        sql = f"""
+            SELECT q.id FROM {FTS_TABLE} JOIN lipapp_question q ON q.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND q.room_id = %s AND q.status <> %s
+            ORDER BY bm25({FTS_TABLE}), q.id DESC LIMIT %s
+        """
+    elif connection.vendor == "postgresql":
+        sql = """
+            SELECT q.id FROM lipapp_question q, to_tsquery('simple', %s) query
+            WHERE q.search_vector @@ query AND q.room_id = %s AND q.status <> %s
+            ORDER BY ts_rank(q.search_vector, query) DESC, q.id DESC LIMIT %s
+        """
+    else:
+        qs = room.questions.exclude(status=Question.STATUS_REJECTED)
+        for word in words:
+            qs = qs.filter(body__icontains=word)
+        return list(qs.order_by("-id")[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_match(connection.vendor, words), room.pk, Question.STATUS_REJECTED, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    by_id = Question.objects.in_bulk(ids)
+    return [by_id[qid] for qid in ids if qid in by_id]
+
+
+def matching(queryset, query: str):
+    """queryset سوال‌ها محدود به تطبیق‌های index (بدون رتبه؛ برای جست‌وجوی admin)."""
+    words = terms(query)
+    if not words:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == "sqlite":
+        sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    elif vendor == "postgresql":
+        sql = "SELECT id FROM lipapp_question WHERE search_vector @@ to_tsquery('simple', %s)"
+    else:
+        for word in words:
+            queryset = queryset.filter(body__icontains=word)
+        return queryset
+    return queryset.filter(pk__in=RawSQL(sql, [_match(vendor, words)]))
@@ -0,0 +1,110 @@
+# lipapp/services/shards.py
+"""
+Sharding اتاق‌ها روی چند Redis با consistent hashing (REDIS_URLS).
+
+همه‌ی کلیدهای یک اتاق (لاگ/seq، leaderboard، نسخه‌ی snapshot، presence، رأی‌ها و
+کانال pubsub آن) با route = "room_<slug>" روی یک shard می‌افتند تا Lua scriptها
+اتمیک بمانند؛ کلیدهای rate-limit با خود کلید route می‌شوند.
+
+هر node با VNODES نقطه روی حلقه است، پس اضافه/حذف یک shard فقط حدود 1/N اتاق‌ها را
+جابه‌جا می‌کند (python manage.py shard_harness).
+"""
+import bisect
+import hashlib
+import threading
+
+from django.conf import settings
+
+from . import redis_clients
+
+VNODES = 512
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+def room_route(slug: str) -> str:
+    return f"room_{slug}"
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes: int = VNODES):
+        self.nodes = list(dict.fromkeys(nodes))
+        if not self.nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._points = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+        self.vnodes = vnodes
+
+    def node(self, route: str) -> str:
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        i = bisect.bisect(self._points, _hash(route)) % len(self._points)
+        return self._owners[i]
+
+    def without(self, node: str) -> "HashRing":
+        """حلقه بدون یک node (برای failover/حذف shard): فقط routeهای همان node جابه‌جا می‌شوند."""
+        return HashRing([n for n in self.nodes if n != node], self.vnodes)
+
+    def with_node(self, node: str) -> "HashRing":
+        return HashRing([*self.nodes, node], self.vnodes)
+
+
+_ring = None
+_lock = threading.Lock()
+
+
+def ring() -> HashRing:
+    global _ring
+    if _ring is None:
+        with _lock:
+            if _ring is None:
+                _ring = HashRing(settings.REDIS_URLS)
+    return _ring
+
+
+def client_for_url(url: str):
+    return redis_clients.sync_client(url)
+
+
+def default():
+    """shard اول (برای چیزهایی که به اتاق خاصی تعلق ندارند)."""
+    return client_for_url(ring().nodes[0])
+
+
+def room(slug: str):
+    return client_for_url(ring().node(room_route(slug)))
+
+
+def key(route: str):
+    return client_for_url(ring().node(route))
+
+
+def all_clients() -> list:
+    return [client_for_url(url) for url in ring().nodes]
+
+
+def room_async(slug: str):
+    """کلاینت redis.asyncio همان shard اتاق، برای event loop جاری (viewهای async)."""
+    return redis_clients.async_client(ring().node(room_route(slug)))
+
+
+def key_async(route: str):
+    return redis_clients.async_client(ring().node(route))
+
+
+class AsyncClients:
+    """
+    route اتاق به کلاینت redis.asyncio همان shard (pool مشترک event loop جاری در redis_clients).
+    """
+
+    def url(self, slug: str) -> str:
+        return ring().node(room_route(slug))
+
+    def get(self, url: str):
+        return redis_clients.async_client(url)
+
+    def room(self, slug: str):
+        return self.get(self.url(slug))
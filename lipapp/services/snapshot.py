@@ -0,0 +1,140 @@
+# lipapp/services/snapshot.py
+"""
+کش snapshot اتاق برای room_view و fragmentها.
+
+هر اتاق یک نسخه‌ی یکنوا در Redis دارد (room:ver:<slug>) که با هر تغییر قابل‌مشاهده
+برای بیننده‌ها bump می‌شود. snapshot ساخته‌شده (اتاق، سوال‌ها، Poll فعال) در حافظه‌ی
+پروسه با همان نسخه نگه داشته می‌شود؛ تا وقتی نسخه عوض نشده هر رندر فقط یک GET به Redis
+هزینه دارد. تعداد اتاق‌ها با LRU محدود است.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import shards
+
+VERSION_TTL = 24 * 3600
+
+
+def version_key(slug: str) -> str:
+    return f"room:ver:{slug}"
+
+
+def bump(slug: str) -> int:
+    """نسخه‌ی اتاق را بعد از هر تغییر (بعد از نوشتن در DB) بالا می‌برد."""
+    pipe = shards.room(slug).pipeline()
+    pipe.incr(version_key(slug))
+    pipe.expire(version_key(slug), VERSION_TTL)
+    ver, _ = pipe.execute()
+    return int(ver)
+
+
+def current_version(slug: str) -> int:
+    return int(shards.room(slug).get(version_key(slug)) or 0)
+
+
+async def bump_async(slug: str) -> int:
+    pipe = shards.room_async(slug).pipeline()
+    pipe.incr(version_key(slug))
+    pipe.expire(version_key(slug), VERSION_TTL)
+    ver, _ = await pipe.execute()
+    return int(ver)
+
+
+async def current_version_async(slug: str) -> int:
+    return int(await shards.room_async(slug).get(version_key(slug)) or 0)
+
+
+class SnapshotCache:
+    """
+    LRU روی اتاق‌ها؛ برای هر اتاق فقط آخرین نسخه نگه داشته می‌شود.
+    max_age سقف کهنگی است (برای تغییراتی که bump نمی‌کنند، مثل امتیاز رأی‌ها یا admin).
+    """
+
+    def __init__(self, max_rooms: int = 500, max_age: float = 2.0):
+        self.max_rooms = max_rooms
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[int, float, dict]] = OrderedDict()
+        self._building: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, slug: str, ver: int):
+        entry = self._entries.get(slug)
+        if entry and entry[0] == ver and time.monotonic() - entry[1] < self.max_age:
+            self._entries.move_to_end(slug)
+            self.hits += 1
+            return entry[2]
+        return None
+
+    def get(self, slug: str, build):
+        """
+        snapshot اتاق را برمی‌گرداند؛ در صورت miss فقط یک thread آن را می‌سازد
+        و بقیه منتظر همان نتیجه می‌مانند (بدون dogpile روی DB).
+        """
+        return self._get(slug, current_version(slug), build)
+
+    async def aget(self, slug: str, build):
+        """
+        نسخه‌ی async: hit فقط یک GET روی redis.asyncio است و thread عوض نمی‌شود.
+        build همان تابع sync است و در miss (با همان قفل ضد dogpile) در thread ساخته می‌شود.
+        """
+        ver = await current_version_async(slug)
+        with self._lock:
+            data = self._lookup(slug, ver)
+            if data is not None:
+                return data
+        return await sync_to_async(self._get)(slug, ver, build)
+
+    def _get(self, slug: str, ver: int, build):
+        with self._lock:
+            data = self._lookup(slug, ver)
+            if data is not None:
+                return data
+            building = self._building.setdefault(slug, threading.Lock())
+
+        with building:
+            with self._lock:
+                data = self._lookup(slug, ver)
+                if data is not None:
+                    return data
+                self.misses += 1
+            data = build()
+            with self._lock:
+                self._entries[slug] = (ver, time.monotonic(), data)
+                self._entries.move_to_end(slug)
+                while len(self._entries) > self.max_rooms:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._building.pop(evicted, None)
+                    self.evictions += 1
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rooms": len(self._entries),
+                "max_rooms": self.max_rooms,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def cache() -> SnapshotCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SnapshotCache(
+                    max_rooms=getattr(settings, "ROOM_SNAPSHOT_MAX_ROOMS", 500),
+                    max_age=getattr(settings, "ROOM_SNAPSHOT_MAX_AGE", 2.0),
+                )
+    return _cache
@@ -0,0 +1,142 @@
+# lipapp/services/votes.py
+"""
+Write-behind برای رأی سوال‌ها.
+
+در حالت VOTE_INGEST="redis":
+  - dedupe رأی با یک set از voterها برای هر سوال (votes:voters:<qid>)
+  - امتیاز زنده با یک counter (votes:score:<qid>) که از score_cached دیتابیس seed می‌شود
+  - هر رأی جدید به صف votes:queue اضافه می‌شود
+و flush() به صورت دوره‌ای صف را batch به batch در Vote و Question.score_cached می‌نویسد.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import shards
+
+QUEUE_KEY = "votes:queue"
+FLUSHING_KEY = "votes:flushing"   # جفت‌های batch در حال نوشتن (تشخیص replay بعد از crash)
+STATE_TTL = 7 * 24 * 3600  # کلیدهای voter/score بعد از یک هفته بی‌استفاده پاک می‌شوند
+
+# KEYS: voters, score, queue   ARGV: voter, seed_score, queue_entry, ttl
+_RECORD_LUA = """
+local added = redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('SET', KEYS[2], ARGV[2], 'NX')
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+if added == 1 then
+  redis.call('RPUSH', KEYS[3], ARGV[3])
+  return {1, redis.call('INCR', KEYS[2])}
+end
+return {0, tonumber(redis.call('GET', KEYS[2]))}
+"""
+
+_script = None
+
+
+def enabled() -> bool:
+    return getattr(settings, "VOTE_INGEST", "db") == "redis"
+
+
+def voters_key(question_id: int) -> str:
+    return f"votes:voters:{question_id}"
+
+
+def score_key(question_id: int) -> str:
+    return f"votes:score:{question_id}"
+
+
+def record(question, voter: str, conn=None) -> tuple[bool, int]:
+    """
+    ثبت رأی فقط در Redis (یک رفت‌وبرگشت، بدون دیتابیس).
+    برمی‌گرداند: (created, score) — score امتیاز زنده‌ی سوال است.
+    conn باید shard اتاق سوال باشد (shards.room(slug)).
+    """
+    global _script
+    conn = conn or shards.room(question.room.slug)
+    if _script is None:
+        _script = conn.register_script(_RECORD_LUA)
+    added, score = _script(
+        keys=[voters_key(question.pk), score_key(question.pk), QUEUE_KEY],
+        args=[voter, question.score_cached, f"{question.pk}|{voter}", STATE_TTL],
+        client=conn,
+    )
+    return bool(added), int(score)
+
+
+def flush(batch_size: int = 500, conn=None) -> int:
+    """
+    یک batch از صف را در دیتابیس می‌نویسد و تعداد رأی‌های ثبت‌شده را برمی‌گرداند.
+
+    صف فقط بعد از commit تراکنش trim می‌شود؛ پس اگر flusher وسط کار بمیرد
+    همان batch دوباره پردازش می‌شود و رأی‌های موجود دوباره شمرده نمی‌شوند.
+    جفت‌های هر batch قبل از commit در FLUSHING_KEY ثبت می‌شوند تا در replay رأی‌هایی که
+    همین flusher نوشته از رأی‌هایی که قبل از صف شدن در دیتابیس بودند جدا شوند
+    (فقط دومی‌ها از counter زنده کم می‌شوند). فقط یک flusher هم‌زمان اجرا کنید.
+    """
+    from ..models import Question, Vote
+
+    conn = conn or shards.default()
+    entries = conn.lrange(QUEUE_KEY, 0, batch_size - 1)
+    if not entries:
+        return 0
+
+    pairs = set()
+    for entry in entries:
+        qid, _, voter = entry.partition("|")
+        if qid.isdigit() and voter:
+            pairs.add((int(qid), voter))
+
+    qids = {qid for qid, _ in pairs}
+    voters = {voter for _, voter in pairs}
+    flushing = set()
+    for member in conn.smembers(FLUSHING_KEY):
+        qid, _, voter = member.partition("|")
+        if qid.isdigit():
+            flushing.add((int(qid), voter))
+    with transaction.atomic():
+        alive = set(Question.objects.filter(pk__in=qids).values_list("pk", flat=True))
+        existing = set(
+            Vote.objects.filter(question_id__in=alive, voter_key__in=voters)
+            .values_list("question_id", "voter_key")
+        )
+        fresh = [(qid, voter) for qid, voter in pairs if qid in alive and (qid, voter) not in existing]
+        if fresh:
+            conn.sadd(FLUSHING_KEY, *[f"{qid}|{voter}" for qid, voter in fresh])
+        Vote.objects.bulk_create(
+            [Vote(question_id=qid, voter_key=voter) for qid, voter in fresh],
+            ignore_conflicts=True,
+        )
+        deltas = Counter(qid for qid, _ in fresh)
+        if deltas:
+            Question.objects.filter(pk__in=deltas).update(
+                score_cached=F("score_cached") + Case(
+                    *[When(pk=qid, then=Value(n)) for qid, n in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+
+    pipe = conn.pipeline()
+    pipe.ltrim(QUEUE_KEY, len(entries), -1)
+    # رأی‌هایی که قبلاً (مثلاً در حالت db) ثبت شده بودند نباید در counter زنده بمانند؛
+    # رأی‌هایی که همین flusher پیش از crash نوشته (در FLUSHING_KEY) قبلاً درست شمرده شده‌اند
+    for qid, _ in (p for p in pairs if p in existing and p not in flushing):
+        pipe.decr(score_key(qid))
+    pipe.delete(FLUSHING_KEY)
+    pipe.execute()
+    return len(fresh)
+
+
+def flush_all(batch_size: int = 500, conn=None) -> int:
+    """
+    تا خالی شدن صف flush می‌کند. بدون conn همه‌ی shardها
+    (هر shard صف رأی‌های اتاق‌های خودش را دارد).
+    """
+    total = 0
+    for conn in [conn] if conn is not None else shards.all_clients():
+        while conn.llen(QUEUE_KEY):
+            total += flush(batch_size, conn=conn)
+    return total
@@ -1,28 +1,43 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-
-urlpatterns = [
-    # Home helpers
-    path("join/", views.join_room, name="join_room"),
-
-    # Rooms
-    path("rooms/new/", views.room_create, name="room_create"),
-    path("r/<slug:slug>/", views.room_view, name="room_view"),
-    path("host/<slug:slug>/", views.host_view, name="host_view"),
-
-    # Questions (HTMX)
-    path("r/<slug:slug>/questions/create/", views.question_create, name="question_create"),
-    path("r/<slug:slug>/questions/<int:pk>/vote/", views.question_vote, name="question_vote"),
-
-    # Host actions
-    path("host/<slug:slug>/questions/<int:pk>/approve/", views.host_approve, name="host_approve"),
-    path("host/<slug:slug>/questions/<int:pk>/reject/", views.host_reject, name="host_reject"),
-    path("host/<slug:slug>/questions/<int:pk>/answer/", views.host_answer, name="host_answer"),
-    path("host/<slug:slug>/questions/<int:pk>/pin/", views.host_pin, name="host_pin"),
-    path("host/<slug:slug>/questions/<int:pk>/unpin/", views.host_unpin, name="host_unpin"),
-
-    # Polls
-    path("host/<slug:slug>/polls/create/", views.poll_create, name="poll_create"),
-    path("host/<slug:slug>/polls/<int:pk>/toggle/", views.poll_toggle, name="poll_toggle"),
-    path("r/<slug:slug>/polls/<int:pk>/vote/<int:option_id>/", views.poll_vote, name="poll_vote"),
-]
+from . import async_views, views
+
+
+def build(fast=views):
+    """
+    fast: ماژول room_view و endpointهای رأی/سوال بیننده
+    (lipapp.async_views با ASYNC_VIEWS، وگرنه همان lipapp.views). bench_views هر دو را می‌سازد.
+    """
+    return [
+        # Home helpers
+        path("join/", views.join_room, name="join_room"),
+
+        # Rooms
+        path("rooms/new/", views.room_create, name="room_create"),
+        path("r/<slug:slug>/", fast.room_view, name="room_view"),
+        path("host/<slug:slug>/", views.host_view, name="host_view"),
+
+        # Questions (HTMX)
+        path("r/<slug:slug>/questions/", views.question_page, name="question_page"),
+        path("r/<slug:slug>/questions/create/", fast.question_create, name="question_create"),
+        path("r/<slug:slug>/questions/<int:pk>/vote/", fast.question_vote, name="question_vote"),
+
+        # Host actions
+        path("host/<slug:slug>/questions/", views.host_question_page, name="host_question_page"),
+        path("host/<slug:slug>/questions/bulk/", views.host_bulk, name="host_bulk"),
+        path("host/<slug:slug>/questions/search/", views.host_search, name="host_search"),
+        path("host/<slug:slug>/questions/<int:pk>/approve/", views.host_approve, name="host_approve"),
+        path("host/<slug:slug>/questions/<int:pk>/reject/", views.host_reject, name="host_reject"),
+        path("host/<slug:slug>/questions/<int:pk>/answer/", views.host_answer, name="host_answer"),
+        path("host/<slug:slug>/questions/<int:pk>/pin/", views.host_pin, name="host_pin"),
+        path("host/<slug:slug>/questions/<int:pk>/unpin/", views.host_unpin, name="host_unpin"),
+
+        # Polls
+        path("host/<slug:slug>/polls/create/", views.poll_create, name="poll_create"),
+        path("host/<slug:slug>/polls/<int:pk>/toggle/", views.poll_toggle, name="poll_toggle"),
+        path("r/<slug:slug>/polls/<int:pk>/vote/<int:option_id>/", fast.poll_vote, name="poll_vote"),
+        path("r/<slug:slug>/poll/", views.poll_block, name="poll_block"),
+    ]
+
+
+urlpatterns = build(async_views if settings.ASYNC_VIEWS else views)
@@ -1,41 +1,167 @@
 # lipapp/views.py
+import logging
+import secrets
+
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
+from django.conf import settings
 from django.views.decorators.http import require_POST
 from django.urls import reverse
+from django.db import transaction
 from django.db.models import F
 from django.template.loader import render_to_string
 
 from .models import Room, Question, Vote, Poll, PollOption
-from .realtime import broadcast_room
+from .hub import hub
+from .realtime import broadcast_host, broadcast_room, broadcast_tally, publisher
+from .services import admission, dedupe, eventlog, identity, ingest, leaderboard, moderation, redis_clients, search, snapshot, votes
 
 # Rate-limit & fingerprint helpers
-from .services.ratelimit import allow, Limit, fingerprint, set_rate_headers, r as redis_conn
+from .services.ratelimit import allow, Limit, fingerprint, set_rate_headers
+
+logger = logging.getLogger(__name__)
 
 
 # -------------------------------------------------------------------
 # Helpers
 # -------------------------------------------------------------------
 
-HOST_SESSION_KEY = "host:{slug}"
-
 def _is_host(request, room: Room) -> bool:
     """
-    نقش میزبان را با ?host=<host_secret> یک‌بار در سشن ست می‌کنیم
-    و سپس در ادامه‌ی درخواست‌ها از سشن چک می‌شود.
+    نقش میزبان را با ?host=<host_secret> یک‌بار در cookie امضاشده‌ی lp_host ست می‌کنیم
+    و سپس در ادامه‌ی درخواست‌ها از همان cookie چک می‌شود (بدون سشن دیتابیسی).
     """
-    key = HOST_SESSION_KEY.format(slug=room.slug)
-    if request.session.get(key):
+    if room.slug in request.host_rooms:
         return True
     token = request.GET.get("host")
     if token and token == room.host_secret:
-        request.session[key] = True
-        request.session.save()
+        identity.grant_host(request, room.slug)
         return True
     return False
 
+def question_delta(q: Question) -> dict:
+    """
+    Delta فشرده برای WebSocket (به‌جای HTML کامل کارت).
+    ws.js این مقادیر را روی کارت موجود patch می‌کند.
+    """
+    return {"id": q.id, "score": q.score_cached, "status": q.status, "pinned": q.is_pinned}
+
+def poll_tally(poll: Poll, options=None) -> dict:
+    """
+    شمارش و درصد گزینه‌ها؛ یک بار روی سرور محاسبه می‌شود و
+    همین dict هم برای poll.tally و هم برای رندر poll-block استفاده می‌شود.
+    options: گزینه‌های از قبل خوانده‌شده (viewهای async با async ORM).
+    """
+    opts = list(poll.options.all()) if options is None else options
+    total = sum(o.votes_cached for o in opts)
+    return {
+        "poll_id": poll.id,
+        "total": total,
+        "options": [
+            {
+                "id": o.id,
+                "label": o.label,
+                "votes": o.votes_cached,
+                "pct": int(round((o.votes_cached / total) * 100)) if total else 0,  # 0..100
+            }
+            for o in opts
+        ],
+    }
+
+def _poll_context(room: Room) -> dict:
+    active_poll = room.polls.filter(is_active=True).order_by("-created_at").first()
+    return {
+        "room": room,
+        "active_poll": active_poll,
+        "poll_options": poll_tally(active_poll)["options"] if active_poll else [],
+    }
+
+def host_row(q: Question, room: Room | None = None) -> dict:
+    """
+    یک سطر پنل میزبان برای event host.row:
+    list = pending | approved | None (سطر حذف می‌شود، مثلاً بعد از reject).
+    host.js سطر را با id پیدا و جایگزین، یا به بالای لیست جدیدش منتقل می‌کند.
+    """
+    list_name = moderation.list_of(q.status)
+    html = ""
+    if list_name:
+        html = render_to_string(f"room/_host_{list_name}_row.html", {"q": q, "room": room or q.room})
+    return {"id": q.id, "list": list_name, "html": html}
+
+def broadcast_moderation(changes):
+    """
+    یک broadcast برای هر اتاق در هر عملیات moderation (تکی یا گروهی):
+      - question.new {items: [{id, html}]}: سوال‌هایی که تازه برای بیننده‌ها قابل‌مشاهده شدند
+      - question.update {items: [delta]}: بقیه (answer/pin/unpin، و reject که کارت را حذف می‌کند)
+      - host.row {items: [...]}: همه‌ی تغییرها برای پنل‌های میزبان باز (فقط ws/host/<slug>/)
+    """
+    by_room: dict[str, list] = {}
+    for change in changes:
+        by_room.setdefault(change.question.room.slug, []).append(change)
+    for slug, room_changes in by_room.items():
+        fresh = [
+            {"id": c.question.id, "html": render_to_string(
+                "room/_question_card.html", {"q": c.question, "room": c.question.room})}
+            for c in room_changes if c.is_visible and not c.was_visible
+        ]
+        deltas = [question_delta(c.question) for c in room_changes if c.was_visible]
+        if fresh:
+            broadcast_room(slug, "question.new", {"items": fresh})
+        if deltas:
+            broadcast_room(slug, "question.update", {"items": deltas})
+        broadcast_host(slug, "host.row", {"items": [host_row(c.question) for c in room_changes]})
+
+def _broadcast_poll_block(room: Room, reason: str):
+    """poll-block یک بار رندر و برای همه ارسال می‌شود (بدون refetch صفحه توسط بیننده‌ها)."""
+    ctx = _poll_context(room)
+    html = render_to_string("room/_poll_block.html", ctx)
+    broadcast_room(room.slug, "poll.update", {"reason": reason, "html": html})
+
+def _room_snapshot(slug: str) -> dict:
+    """
+    context صفحه‌ی بیننده از کش snapshot (با نسخه‌ی اتاق).
+    seq قبل از خواندن DB گرفته می‌شود تا ws.js با ?since=seq هر eventی را که
+    بعد از آن آمده replay کند (تکرار یک delta بی‌ضرر است، از دست رفتنش نه).
+    Http404 کش نمی‌شود.
+    """
+    return snapshot.cache().get(slug, lambda: _build_room_snapshot(slug))
+
+def _build_room_snapshot(slug: str) -> dict:
+    seq = eventlog.current_seq(slug)
+    room = get_object_or_404(Room, slug=slug, is_live=True)
+    questions, next_cursor = _question_page(room)
+    return {"seq": seq, "questions": questions, "next_cursor": next_cursor, **_poll_context(room)}
+
+def _question_page(room: Room, cursor: str | None = None):
+    """
+    یک صفحه از سوال‌های قابل‌مشاهده به ترتیب leaderboard (pinned، امتیاز، قدمت).
+    هزینه‌ی هر صفحه ثابت است: یک ZRANGE و یک in_bulk، مستقل از اندازه‌ی اتاق.
+    """
+    items, next_cursor = leaderboard.page(room, cursor, limit=settings.QUESTION_PAGE_SIZE)
+    by_id = Question.objects.in_bulk([qid for qid, _ in items])
+    questions = []
+    for qid, score in items:
+        q = by_id.get(qid)
+        if q is None or q.room_id != room.id or q.status not in Question.VISIBLE_STATUSES:
+            continue
+        if score is not None:
+            q.score_cached = score  # در حالت VOTE_INGEST=redis امتیاز زنده است
+        questions.append(q)
+    return questions, next_cursor
+
+def _pending_page(room: Room, after: int = 0):
+    """صف pending با keyset روی id (به ترتیب ورود)."""
+    size = settings.QUESTION_PAGE_SIZE
+    rows = list(
+        room.questions.filter(status=Question.STATUS_PENDING, id__gt=after).order_by("id")[: size + 1]
+    )
+    next_cursor = str(rows[size - 1].id) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+HOST_QUICK_ADD = "host-quick-add"  # id فرم Quick add در host.html (هدر HX-Target)
+
 def voter_key(request) -> str:
-    """برای Vote از همان fingerprint استفاده می‌کنیم."""
+    """برای Vote از همان fingerprint (شناسه‌ی امضاشده‌ی بیننده) استفاده می‌کنیم."""
     return fingerprint(request)
 
 
@@ -59,38 +185,23 @@ def room_create(request):
 
 def room_view(request, slug):
     """
-    صفحه‌ی بیننده: سوال‌ها + Poll فعال.
-    درصد Poll در این ویو محاسبه می‌شود تا داخل قالب CSS inline/templating نداشته باشیم.
+    صفحه‌ی بیننده: سوال‌ها + Poll فعال (از snapshot نسخه‌دار اتاق).
+    درصد Poll در poll_tally محاسبه می‌شود تا داخل قالب CSS inline/templating نداشته باشیم.
     """
-    room = get_object_or_404(Room, slug=slug, is_live=True)
-    questions = (
-        room.questions.filter(status__in=[Question.STATUS_APPROVED, Question.STATUS_ANSWERED])
-        .order_by(F("pinned_at").desc(nulls_last=True), "-score_cached", "created_at")
-    )
+    return render(request, "room/view.html", _room_snapshot(slug))
 
-    active_poll = room.polls.filter(is_active=True).order_by("-created_at").first()
-    poll_options_ctx = []
-    if active_poll:
-        opts = list(active_poll.options.all())
-        total = sum(o.votes_cached for o in opts) or 0
-        for o in opts:
-            pct = int(round((o.votes_cached / total) * 100)) if total else 0
-            poll_options_ctx.append({
-                "id": o.id,
-                "label": o.label,
-                "votes": o.votes_cached,
-                "pct": pct,  # 0..100
-            })
 
+def question_page(request, slug):
+    """صفحه‌ی بعدی سوال‌ها برای infinite scroll (?cursor=...)."""
+    room = get_object_or_404(Room, slug=slug, is_live=True)
+    cursor = request.GET.get("cursor") or None
+    if cursor is not None and not cursor.isdigit():
+        return HttpResponseBadRequest("Invalid cursor")
+    questions, next_cursor = _question_page(room, cursor)
     return render(
         request,
-        "room/view.html",
-        {
-            "room": room,
-            "questions": questions,
-            "active_poll": active_poll,
-            "poll_options": poll_options_ctx,
-        },
+        "room/_question_page.html",
+        {"room": room, "questions": questions, "next_cursor": next_cursor},
     )
 
 
@@ -103,11 +214,8 @@ def host_view(request, slug):
     if not _is_host(request, room):
         return HttpResponseForbidden("Invalid host token")
 
-    pending = room.questions.filter(status=Question.STATUS_PENDING).order_by("created_at")
-    approved = (
-        room.questions.exclude(status=Question.STATUS_PENDING)
-        .order_by(F("pinned_at").desc(nulls_last=True), "-score_cached", "created_at")
-    )
+    pending, pending_cursor = _pending_page(room)
+    approved, approved_cursor = _question_page(room)
 
     viewer_url = request.build_absolute_uri(reverse("room_view", kwargs={"slug": room.slug}))
     host_url = request.build_absolute_uri(reverse("host_view", kwargs={"slug": room.slug})) + f"?host={room.host_secret}"
@@ -119,7 +227,9 @@ def host_view(request, slug):
         {
             "room": room,
             "pending": pending,
+            "pending_cursor": pending_cursor,
             "approved": approved,
+            "approved_cursor": approved_cursor,
             "viewer_url": viewer_url,
             "host_url": host_url,
             "polls": polls,
@@ -127,6 +237,57 @@ def host_view(request, slug):
     )
 
 
+def host_question_page(request, slug):
+    """صفحه‌ی بعدی لیست‌های میزبان (?list=pending|approved&cursor=...)."""
+    room = get_object_or_404(Room, slug=slug)
+    if not _is_host(request, room):
+        return HttpResponseForbidden("Invalid host token")
+    list_name = request.GET.get("list")
+    cursor = request.GET.get("cursor") or ""
+    if list_name not in ("pending", "approved") or not cursor.isdigit():
+        return HttpResponseBadRequest("Invalid list or cursor")
+    if list_name == "pending":
+        questions, next_cursor = _pending_page(room, int(cursor))
+    else:
+        questions, next_cursor = _question_page(room, cursor)
+    return render(
+        request,
+        "room/_host_question_page.html",
+        {"room": room, "questions": questions, "next_cursor": next_cursor, "list_name": list_name},
+    )
+
+
+def host_search(request, slug):
+    """جست‌وجوی متن کامل سوال‌های اتاق برای میزبان (?q=...)، مرتب‌شده بر اساس ارتباط."""
+    room = get_object_or_404(Room, slug=slug)
+    if not _is_host(request, room):
+        return HttpResponseForbidden("Invalid host token")
+    query = request.GET.get("q", "").strip()
+    results = search.ranked(room, query, limit=settings.HOST_SEARCH_LIMIT) if query else []
+    return render(request, "room/_host_search_results.html", {"room": room, "query": query, "results": results})
+
+
+def ingest_backlogged():
+    """صف سوال‌ها پر است (QUESTION_INGEST_MAX_BACKLOG)؛ کلاینت کمی بعد دوباره امتحان کند."""
+    resp = HttpResponse("Too many queued questions, try again shortly", status=503)
+    resp["Retry-After"] = "5"
+    return resp
+
+
+def _question_ack(request, room: Room, q: Question | None):
+    """
+    پاسخ سبک question_create (بدون رندر دوباره‌ی صفحه):
+      - Quick add میزبان: همان سطر out-of-band در بالای صف pending
+        (در حالت ingest سطر بعداً با host.row می‌رسد؛ 202 خالی)
+      - بیننده: فقط فرم خالی با پیام تأیید (#question-form)
+    """
+    if request.headers.get("HX-Target") == HOST_QUICK_ADD:
+        if q is None:
+            return HttpResponse(status=202)
+        return render(request, "room/_host_changes.html", {"room": room, "changes": [moderation.Change(q, None)]})
+    return render(request, "room/_question_form.html", {"room": room, "ack": True})
+
+
 @require_POST
 def question_create(request, slug):
     """
@@ -149,14 +310,44 @@ def question_create(request, slug):
     if not body:
         return HttpResponseBadRequest("Empty question")
 
-    Question.objects.create(room=room, author_name=author, body=body)  # status = pending
-
-    # Host side: htmx با hx-select فقط #host-lists را از پاسخ host_view برمی‌دارد
-    if request.headers.get("HX-Target") == "host-lists":
-        return host_view(request, slug)
-
-    # Viewer side: htmx با hx-select فقط فرم را جایگزین می‌کند
-    return room_view(request, slug)
+    if ingest.enabled():
+        # فقط XADD؛ flush_questions سوال را batch می‌سازد و به پنل‌های میزبان host.row می‌فرستد
+        try:
+            ingest.submit(room, body, author)
+        except ingest.Backlogged:
+            return ingest_backlogged()
+        q = None
+    else:
+        # MinHash سوال با سطل‌های LSH اتاق مقایسه می‌شود (یک رفت‌وبرگشت، مستقل از اندازه‌ی اتاق)
+        # خطای Redis در dedupe نباید ثبت سوال را بشکند؛ سوال بدون flag تکراری ساخته می‌شود
+        try:
+            sig, duplicate_of = dedupe.match(room.slug, body)
+        except Exception:
+            logger.warning("dedupe match for room %s failed", room.slug, exc_info=True)
+            sig, duplicate_of = None, None
+        q = Question.objects.create(
+            room=room, author_name=author, body=body, duplicate_of_id=duplicate_of
+        )  # status = pending
+        try:
+            dedupe.add(room.slug, q.id, sig)
+        except Exception:
+            logger.warning("dedupe add for question %d failed", q.id, exc_info=True)
+        # سوال pending در snapshot بیننده نیست؛ پس نسخه‌ی اتاق bump نمی‌شود
+        # فقط پنل‌های میزبان سطر جدید صف pending را می‌گیرند
+        broadcast_host(room.slug, "host.row", {"items": [host_row(q, room)]})
+    return _question_ack(request, room, q)
+
+
+def count_vote(q: Question, vkey: str) -> bool:
+    """
+    رأی یکتای voter و افزایش score_cached سوال در یک تراکنش (VOTE_INGEST=db).
+    False یعنی این voter قبلاً رأی داده بود.
+    """
+    with transaction.atomic():
+        _, created = Vote.objects.get_or_create(question=q, voter_key=vkey)
+        if created:
+            Question.objects.filter(pk=q.pk).update(score_cached=F("score_cached") + 1)
+    return created
 
 
 @require_POST
@@ -171,104 +362,120 @@ def question_vote(request, slug, pk):
         Question, pk=pk, room=room, status__in=[Question.STATUS_APPROVED, Question.STATUS_ANSWERED]
     )
 
-    # Rate limit
+    # Rate limit + قفل 1ثانیه‌ای + رأی تکراری: همه در یک Lua script (یک RTT)
     fp = fingerprint(request)
-    key = f"q:vote:{slug}:{fp}"
+    vkey = voter_key(request)
     lim = Limit(limit=5, window=10)
-    ok, remaining, reset = allow(key, lim)
-    if not ok:
+    verdict = admission.admit_vote(slug, q, fp, vkey, lim)
+    if verdict.status == admission.RATE_LIMITED:
         resp = HttpResponseBadRequest("Rate limit exceeded")
-        return set_rate_headers(resp, remaining, reset, lim)
-
-    # Short lock (1s) per question/user
-    lock_key = f"lock:vote:{slug}:{pk}:{fp}"
-    if redis_conn().set(lock_key, "1", nx=True, ex=1) is None:
+        return set_rate_headers(resp, verdict.remaining, verdict.reset, lim)
+    if verdict.status == admission.DEBOUNCED:
         return HttpResponseBadRequest("Slow down")
 
     # Unique vote per user/question
-    vkey = voter_key(request)
-    obj, created = Vote.objects.get_or_create(question=q, voter_key=vkey)
+    created = False
+    if verdict.status == admission.DUPLICATE:
+        if verdict.score is not None:
+            q.score_cached = verdict.score
+    elif votes.enabled():
+        # write-behind: script رأی را در Redis شمرد؛ flush_votes بعداً در دیتابیس می‌نویسد
+        created, q.score_cached = True, verdict.score
+    else:
+        created = count_vote(q, vkey)
+        # فقط بعد از commit؛ نوشتن ناموفق voter را "تکراری" علامت نمی‌زند
+        transaction.on_commit(lambda: admission.remember_vote(slug, q, vkey))
+        if created:
+            q.refresh_from_db(fields=["score_cached"])
     if created:
-        Question.objects.filter(pk=q.pk).update(score_cached=F("score_cached") + 1)
-        q.refresh_from_db(fields=["score_cached"])
-
-    # Broadcast updated card to all viewers
-    card_html = render_to_string("room/_question_card.html", {"q": q, "room": room})
-    broadcast_room(room.slug, "vote.tally", {"id": q.id, "html": card_html})
+        leaderboard.set_score(room.slug, q)
+        # Broadcast score delta to all viewers (ادغام‌شده در پنجره‌ی BROADCAST_COALESCE_MS)
+        broadcast_tally(room.slug, "vote.tally", q.id, question_delta(q))
 
     # Return the updated card for htmx target
     return render(request, "room/_question_card.html", {"q": q, "room": room})
 
 
-@require_POST
-def host_approve(request, slug, pk):
+def _moderate(request, room: Room, questions, action: str, must_exist: bool = False):
+    """
+    action را اعمال و broadcast می‌کند؛ پاسخ فقط fragment سطرهای تغییرکرده است
+    (htmx out-of-band در پنل همین میزبان)، نه رندر دوباره‌ی کل پنل.
+    must_exist: اگر چیزی عوض نشد و سوالی هم نبود 404 (actionهای تک‌سوالی).
+    """
+    changes = moderation.apply(questions, action)
+    if not changes and must_exist and not questions.exists():
+        raise Http404("No such question")
+    broadcast_moderation(changes)
+    return render(request, "room/_host_changes.html", {"room": room, "changes": changes})
+
+
+def _host_action(request, slug, pk, action: str):
     room = get_object_or_404(Room, slug=slug)
     if not _is_host(request, room):
         return HttpResponseForbidden("Invalid host token")
-    q = get_object_or_404(Question, pk=pk, room=room)
-    q.approve()
+    return _moderate(request, room, room.questions.filter(pk=pk), action, must_exist=True)
 
-    # Broadcast new question card for viewers
-    card_html = render_to_string("room/_question_card.html", {"q": q, "room": room})
-    broadcast_room(room.slug, "question.new", {"id": q.id, "html": card_html})
 
-    # Refresh host lists (htmx will hx-select #host-lists)
-    return host_view(request, slug)
+@require_POST
+def host_approve(request, slug, pk):
+    return _host_action(request, slug, pk, "approve")
 
 
 @require_POST
 def host_reject(request, slug, pk):
-    room = get_object_or_404(Room, slug=slug)
-    if not _is_host(request, room):
-        return HttpResponseForbidden("Invalid host token")
-    q = get_object_or_404(Question, pk=pk, room=room)
-    q.reject()
-    return host_view(request, slug)
+    return _host_action(request, slug, pk, "reject")
 
 
 @require_POST
 def host_answer(request, slug, pk):
-    room = get_object_or_404(Room, slug=slug)
-    if not _is_host(request, room):
-        return HttpResponseForbidden("Invalid host token")
-    q = get_object_or_404(Question, pk=pk, room=room)
-    q.mark_answered()
-
-    card_html = render_to_string("room/_question_card.html", {"q": q, "room": room})
-    broadcast_room(room.slug, "question.update", {"id": q.id, "html": card_html})
-    return host_view(request, slug)
+    return _host_action(request, slug, pk, "answer")
 
 
 @require_POST
 def host_pin(request, slug, pk):
-    room = get_object_or_404(Room, slug=slug)
-    if not _is_host(request, room):
-        return HttpResponseForbidden("Invalid host token")
-    q = get_object_or_404(Question, pk=pk, room=room)
-    q.pin()
-
-    card_html = render_to_string("room/_question_card.html", {"q": q, "room": room})
-    broadcast_room(room.slug, "question.update", {"id": q.id, "html": card_html})
-    return host_view(request, slug)
+    return _host_action(request, slug, pk, "pin")
 
 
 @require_POST
 def host_unpin(request, slug, pk):
+    return _host_action(request, slug, pk, "unpin")
+
+
+@require_POST
+def host_bulk(request, slug):
+    """
+    moderation گروهی: action=approve|reject|answer|pin|unpin و ids=<id>... (چک‌باکس‌های پنل).
+    فقط fragment سطرهای تغییرکرده برمی‌گردد (htmx out-of-band)، نه کل پنل.
+    """
     room = get_object_or_404(Room, slug=slug)
     if not _is_host(request, room):
         return HttpResponseForbidden("Invalid host token")
-    q = get_object_or_404(Question, pk=pk, room=room)
-    q.unpin()
+    action = request.POST.get("action")
+    if action not in moderation.ACTIONS:
+        return HttpResponseBadRequest("Invalid action")
+    ids = [int(i) for i in request.POST.getlist("ids") if i.isdigit()]
+    if not ids:
+        return HttpResponseBadRequest("No questions selected")
+    if len(ids) > moderation.MAX_BATCH:
+        return HttpResponseBadRequest(f"At most {moderation.MAX_BATCH} questions per request")
 
-    card_html = render_to_string("room/_question_card.html", {"q": q, "room": room})
-    broadcast_room(room.slug, "question.update", {"id": q.id, "html": card_html})
-    return host_view(request, slug)
+    return _moderate(request, room, room.questions.filter(pk__in=ids), action)
 
 
 # -------------------------------------------------------------------
-# Polls (no partials; viewer refreshes poll-block from full page)
+# Polls (tallies pushed over WebSocket; poll-block fragment for resync)
 # -------------------------------------------------------------------
 
+def poll_block(request, slug):
+    """فقط poll-block؛ برای کلاینت‌هایی که event را از دست داده‌اند (مثلاً بعد از reconnect)."""
+    return render(request, "room/_poll_block.html", _room_snapshot(slug))
+
+
+def _host_polls(request, room: Room):
+    """فقط بلوک #polls-host پنل میزبان (نه کل پنل)."""
+    return render(request, "room/_host_polls.html", {"room": room, "polls": room.polls.order_by("-created_at")})
+
+
 @require_POST
 def poll_create(request, slug):
     room = get_object_or_404(Room, slug=slug)
@@ -288,10 +495,11 @@ def poll_create(request, slug):
     room.polls.filter(is_active=True).update(is_active=False)
     poll = Poll.objects.create(room=room, question=question, is_active=True)
     PollOption.objects.bulk_create([PollOption(poll=poll, label=o) for o in opts])
+    snapshot.bump(room.slug)
 
-    # Viewers fetch poll-block (signal only)
-    broadcast_room(room.slug, "poll.update", {"reason": "created"})
-    return host_view(request, slug)
+    # poll-block جدید یک بار رندر و برای بیننده‌ها ارسال می‌شود
+    _broadcast_poll_block(room, "created")
+    return _host_polls(request, room)
 
 
 @require_POST
@@ -308,9 +516,22 @@ def poll_toggle(request, slug, pk):
         room.polls.filter(is_active=True).update(is_active=False)
         poll.is_active = True
         poll.save(update_fields=["is_active"])
+    snapshot.bump(room.slug)
 
-    broadcast_room(room.slug, "poll.update", {"reason": "toggled"})
-    return host_view(request, slug)
+    _broadcast_poll_block(room, "toggled")
+    return _host_polls(request, room)
+
+
+def count_poll_vote(poll: Poll, option_id: int) -> bool:
+    """
+    شمارش رأی گزینه و مجموع Poll (کش DB) در یک تراکنش.
+    UPDATE خودش چک می‌کند گزینه مال همین Poll است؛ False یعنی گزینه‌ی نامعتبر.
+    """
+    with transaction.atomic():
+        updated = PollOption.objects.filter(pk=option_id, poll=poll).update(votes_cached=F("votes_cached") + 1)
+        if updated:
+            Poll.objects.filter(pk=poll.pk).update(total_votes_cached=F("total_votes_cached") + 1)
+    return bool(updated)
 
 
 @require_POST
@@ -334,13 +555,18 @@ def poll_vote(request, slug, pk, option_id):
         resp = HttpResponseBadRequest("Rate limit exceeded")
         return set_rate_headers(resp, remaining, reset, lim)
 
-    # افزایش شمارش رأی گزینه (کش DB)
-    PollOption.objects.filter(pk=option.pk).update(votes_cached=F("votes_cached") + 1)
+    count_poll_vote(poll, option.pk)
+    snapshot.bump(room.slug)
 
-    # اطلاع به بیننده‌ها برای تازه‌سازی poll-block
-    broadcast_room(room.slug, "poll.update", {"reason": "vote"})
-    # بازگرداندن کل صفحه‌ی viewer؛ htmx با hx-select فقط #poll-block را جایگزین می‌کند
-    return room_view(request, slug)
+    # شمارش و درصدها یک بار محاسبه و (ادغام‌شده) برای بیننده‌ها ارسال می‌شوند
+    tally = poll_tally(poll)
+    broadcast_tally(room.slug, "poll.tally", poll.id, tally)
+    # فقط poll-block برمی‌گردد؛ htmx آن را جایگزین #poll-block می‌کند
+    return render(
+        request,
+        "room/_poll_block.html",
+        {"room": room, "active_poll": poll, "poll_options": tally["options"]},
+    )
 
 def home(request):
     return render(request, "home.html")
@@ -354,11 +580,30 @@ def join_room(request):
 
 
 from django.http import JsonResponse
-from django.conf import settings
 
 def healthz(request):
     return JsonResponse({"ok": True})
 
+def metrics_allowed(request) -> bool:
+    """/metrics فقط برای staff یا درخواست با `Authorization: Bearer <METRICS_TOKEN>`."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+    return bool(token) and scheme.lower() == "bearer" and secrets.compare_digest(given.strip().encode(), token.encode())
+
+def metrics(request):
+    # host:port واقعی Redis و جزئیات داخلی hub/publisher نباید عمومی باشند
+    if not metrics_allowed(request):
+        return HttpResponseForbidden("Metrics require staff login or METRICS_TOKEN")
+    return JsonResponse({
+        "broadcast": publisher().stats(),
+        "hub": hub.stats(),
+        "redis": redis_clients.stats(),
+        "room_snapshots": snapshot.cache().stats(),
+    })
+
 def version(request):
     return JsonResponse({
         "name": "LivePulse",
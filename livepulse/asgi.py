@@ -7,10 +7,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "livepulse.settings")
 
 django_asgi_app = get_asgi_application()
 
-from lipapp.consumers import RoomConsumer  # ⬅️ بعد از setdefault
+from lipapp.consumers import HostConsumer, RoomConsumer  # ⬅️ بعد از setdefault
 
 websocket_urlpatterns = [
     path("ws/room/<slug:slug>/", RoomConsumer.as_asgi()),
+    path("ws/host/<slug:slug>/", HostConsumer.as_asgi()),
 ]
 
 application = ProtocolTypeRouter({
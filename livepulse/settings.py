@@ -53,9 +53,10 @@ INSTALLED_APPS = [
 # -------------------------
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # استاتیک‌ها در prod
+    "lipapp.middleware.WhiteNoiseMiddleware",  # استاتیک‌ها در prod (WhiteNoise با مسیر async)
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "lipapp.services.identity.VoterIdentityMiddleware",  # cookie امضاشده‌ی بیننده/میزبان (بدون سشن)
     "django_htmx.middleware.HtmxMiddleware",       # htmx detection (اختیاری اما مفید)
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -63,6 +64,14 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# -------------------------
+# Sessions
+# -------------------------
+# بیننده‌ها و میزبان‌ها دیگر به سشن نیاز ندارند (services.identity)؛ سشن فقط برای admin است.
+# برای حذف کامل جدول django_session:
+#   SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.db")
+
 # -------------------------
 # URLs / WSGI / ASGI
 # -------------------------
@@ -138,12 +147,106 @@ STORAGES = {
 # Channels / Redis
 # -------------------------
 REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+# چند Redis با کاما: اتاق‌ها با consistent hashing روی آن‌ها پخش می‌شوند (lipapp/services/shards.py)
+REDIS_URLS = [u.strip() for u in os.getenv("REDIS_URLS", REDIS_URL).split(",") if u.strip()]
+# poolهای مشترک (lipapp/services/redis_clients.py)؛ اندازه به ازای هر shard
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))               # sync، مشترک بین threadها
+REDIS_ASYNC_POOL_SIZE = int(os.getenv("REDIS_ASYNC_POOL_SIZE", "100"))  # به ازای هر event loop
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))        # انتظار برای اتصال آزاد
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+# channel layer دیگر مسیر broadcast نیست (hub و publisher مستقیم روی shard اتاق publish می‌کنند)؛
+# channels_redis با hash خودش روی نام channel/group shard می‌کند نه با حلقه‌ی اتاق‌ها،
+# پس فقط روی REDIS_URL می‌ماند (برای send دستی/ابزارها) و REDIS_URLS را پوشش نمی‌دهد
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {"hosts": [REDIS_URL]},
     }
 }
+# پنجره‌ی ادغام tallyها (میلی‌ثانیه)؛ 0 یعنی ارسال فوری
+BROADCAST_COALESCE_MS = int(os.getenv("BROADCAST_COALESCE_MS", "150"))
+# صف outbox (publisher پس‌زمینه)؛ اگر پر شد eventها دور ریخته و در /metrics شمرده می‌شوند
+BROADCAST_QUEUE_SIZE = int(os.getenv("BROADCAST_QUEUE_SIZE", "10000"))
+# صف خروجی هر WebSocket؛ با عبور از هر سقف، socket با کد 4008 بسته و کلاینت resync می‌شود
+WS_SEND_QUEUE_FRAMES = int(os.getenv("WS_SEND_QUEUE_FRAMES", "64"))
+WS_SEND_QUEUE_BYTES = int(os.getenv("WS_SEND_QUEUE_BYTES", str(256 * 1024)))
+WS_SEND_MAX_LAG = float(os.getenv("WS_SEND_MAX_LAG", "10"))   # ثانیه؛ سن قدیمی‌ترین frame منتظر
+# admission روی handshakeهای WebSocket در هر پروسه (token bucket)؛ 0 یعنی بدون محدودیت
+WS_ACCEPT_RATE = float(os.getenv("WS_ACCEPT_RATE", "200"))    # handshake در ثانیه
+WS_ACCEPT_BURST = int(os.getenv("WS_ACCEPT_BURST", "400"))
+# شمارش بیننده‌ها (HyperLogLog)؛ هر چند ثانیه heartbeat و push به میزبان‌ها
+PRESENCE_INTERVAL = float(os.getenv("PRESENCE_INTERVAL", "15"))
+# لاگ eventهای هر اتاق (Redis stream) برای replay با ?since=<seq> بعد از reconnect
+ROOM_LOG_SIZE = int(os.getenv("ROOM_LOG_SIZE", "500"))
+ROOM_LOG_TTL = int(os.getenv("ROOM_LOG_TTL", str(24 * 3600)))
+
+# -------------------------
+# Rate limiting
+# -------------------------
+# "gcra": token bucket با یک کلید برای هر subject + رد محلی (پیش‌فرض)؛ "fixed": Fixed Window قدیمی
+RATELIMIT_BACKEND = os.getenv("RATELIMIT_BACKEND", "gcra")
+RATELIMIT_REJECT_CACHE_SIZE = int(os.getenv("RATELIMIT_REJECT_CACHE_SIZE", "10000"))
+
+# -------------------------
+# Room snapshot cache (room_view / fragments)
+# -------------------------
+ROOM_SNAPSHOT_MAX_ROOMS = int(os.getenv("ROOM_SNAPSHOT_MAX_ROOMS", "500"))   # LRU روی اتاق‌ها
+ROOM_SNAPSHOT_MAX_AGE = float(os.getenv("ROOM_SNAPSHOT_MAX_AGE", "2.0"))     # ثانیه؛ سقف کهنگی امتیازها
+QUESTION_PAGE_SIZE = int(os.getenv("QUESTION_PAGE_SIZE", "30"))              # top N، بعد "load more"
+
+# -------------------------
+# Votes
+# -------------------------
+# "db": هر رأی مستقیم در دیتابیس ثبت می‌شود
+# "redis": write-behind؛ رأی‌ها در Redis شمرده می‌شوند و `manage.py flush_votes` آن‌ها را batch می‌نویسد
+VOTE_INGEST = os.getenv("VOTE_INGEST", "db")
+VOTE_FLUSH_BATCH = int(os.getenv("VOTE_FLUSH_BATCH", "500"))
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "1.0"))  # ثانیه
+
+# -------------------------
+# Question ingest
+# -------------------------
+# "db": هر سوال مستقیم در دیتابیس ساخته می‌شود
+# "redis": سوال‌ها در stream Redis صف می‌شوند و `manage.py flush_questions` آن‌ها را با bulk_create می‌نویسد
+QUESTION_INGEST = os.getenv("QUESTION_INGEST", "db")
+QUESTION_FLUSH_BATCH = int(os.getenv("QUESTION_FLUSH_BATCH", "500"))
+QUESTION_FLUSH_INTERVAL = float(os.getenv("QUESTION_FLUSH_INTERVAL", "0.5"))  # ثانیه
+QUESTION_INGEST_MAX_BACKLOG = int(os.getenv("QUESTION_INGEST_MAX_BACKLOG", "100000"))  # هر shard؛ بیشتر: 503
+
+# -------------------------
+# Near-duplicate questions
+# -------------------------
+# MinHash/LSH برای هر اتاق (lipapp.services.dedupe)؛ سوال جدید به سوال قبلیِ مشابه flag می‌شود (duplicate_of)
+QUESTION_DEDUPE = os.getenv("QUESTION_DEDUPE", "true").lower() == "true"
+QUESTION_DEDUPE_BACKEND = os.getenv("QUESTION_DEDUPE_BACKEND", "redis")        # "local" فقط تک‌پروسه/تست
+QUESTION_DEDUPE_THRESHOLD = float(os.getenv("QUESTION_DEDUPE_THRESHOLD", "0.6"))  # Jaccard تخمینی
+
+# -------------------------
+# Host search
+# -------------------------
+# جست‌وجوی متن کامل سوال‌ها در پنل میزبان (SQLite FTS5 / Postgres tsvector+GIN؛ lipapp.services.search)
+HOST_SEARCH_LIMIT = int(os.getenv("HOST_SEARCH_LIMIT", "20"))
+
+# -------------------------
+# Async views
+# -------------------------
+# true: room_view و endpointهای رأی/سوال از lipapp.async_views (async ORM + redis.asyncio، بدون thread hop زیر daphne)
+# false: همان viewهای sync در lipapp.views (مثلاً زیر WSGI). مقایسه: `manage.py bench_views`
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "true").lower() == "true"
+
+# -------------------------
+# Admin
+# -------------------------
+# changelist بدون فیلتر Vote از این تعداد سطر به بالا تعداد تخمینی نشان می‌دهد (نه COUNT(*) کامل)
+ADMIN_ESTIMATED_COUNT_MIN = int(os.getenv("ADMIN_ESTIMATED_COUNT_MIN", "100000"))
+
+# -------------------------
+# Metrics
+# -------------------------
+# /metrics فقط برای staff یا scraper با `Authorization: Bearer <METRICS_TOKEN>`؛ خالی یعنی فقط staff
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # -------------------------
 # Security behind proxy (Render/Railway/…)
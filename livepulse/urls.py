@@ -7,5 +7,6 @@ urlpatterns = [
     path("", views.home, name="home"),      # صفحهٔ خانه‌ی واقعی
     path("healthz", views.healthz, name="healthz"),
     path("version", views.version, name="version"),
+    path("metrics", views.metrics, name="metrics"),
     path("", include("lipapp.urls")),       # روت‌های اپ
 ]
@@ -0,0 +1,85 @@
+// چک‌باکس "All" هر فرم moderation گروهی: همه‌ی سطرهای همان لیست (form="bulk-...") را انتخاب می‌کند
+document.addEventListener("change", (ev) => {
+  const formId = ev.target.getAttribute && ev.target.getAttribute("data-select-all");
+  if (!formId) return;
+  document.querySelectorAll(`input[name="ids"][form="${formId}"]`).forEach((box) => { box.checked = ev.target.checked; });
+});
+
+// سطرهای پنل: host.row از ws/host و پاسخ out-of-band actionها هر دو یک سطر را می‌آورند؛
+// هر کدام زودتر برسد، نسخه‌ی تکراری حذف می‌شود (id یکتا: host-q-<id>)
+function dedupeHostRows() {
+  const seen = new Set();
+  document.querySelectorAll('[id^="host-q-"]').forEach((row) => {
+    if (seen.has(row.id)) row.remove(); else seen.add(row.id);
+  });
+}
+
+function syncHostEmpty() {
+  document.querySelectorAll("[data-empty-for]").forEach((note) => {
+    const rows = document.getElementById(note.getAttribute("data-empty-for"));
+    note.classList.toggle("hidden", !!(rows && rows.querySelector('[id^="host-q-"]')));
+  });
+}
+
+document.addEventListener("htmx:oobAfterSwap", () => { dedupeHostRows(); syncHostEmpty(); });
+document.addEventListener("htmx:afterSettle", () => { dedupeHostRows(); syncHostEmpty(); });
+
+(function () {
+  const el = document.getElementById("ws-host-slug");
+  if (!el) return;
+  const slug = el.getAttribute("data-slug");
+  const proto = location.protocol === "https:" ? "wss" : "ws";
+  const url = `${proto}://${location.host}/ws/host/${slug}/`;
+
+  // viewers = تعداد بیننده‌های یکتا در ۱-۲ دقیقه‌ی اخیر (HyperLogLog روی سرور)
+  function setViewers(n) {
+    document.querySelectorAll('[data-role="viewers"]').forEach((node) => { node.textContent = n; });
+  }
+
+  // item = {id, list: "pending" | "approved" | null, html}؛ list=null یعنی سطر حذف شود
+  function applyRow(item) {
+    const existing = document.getElementById(`host-q-${item.id}`);
+    const rows = item.list && document.getElementById(`host-${item.list}-rows`);
+    if (!rows) {
+      if (existing) existing.remove();
+      return;
+    }
+    const tmp = document.createElement("div");
+    tmp.innerHTML = item.html;
+    const row = tmp.firstElementChild;
+    if (!row) return;
+    if (existing && existing.parentElement === rows) {
+      // انتخاب چک‌باکس میزبان با به‌روزرسانی سطر از بین نرود
+      const box = existing.querySelector('input[name="ids"]');
+      const fresh = row.querySelector('input[name="ids"]');
+      if (box && fresh) fresh.checked = box.checked;
+      existing.replaceWith(row);
+    } else {
+      if (existing) existing.remove();
+      rows.prepend(row);
+    }
+    window.htmx && window.htmx.process(row);
+  }
+
+  // همان backoff با jitter در ws.js
+  let attempt = 0;
+  function connect() {
+    const ws = new WebSocket(url);
+    ws.onopen = () => { attempt = 0; };
+    ws.onclose = () => {
+      const cap = Math.min(30000, 1000 * 2 ** attempt);
+      attempt += 1;
+      setTimeout(connect, Math.random() * cap);
+    };
+    ws.onerror = () => {};
+    ws.onmessage = (ev) => {
+      let data; try { data = JSON.parse(ev.data); } catch { return; }
+      if (data.event === "presence") setViewers(data.viewers);
+      if (data.event === "host.row") {
+        (data.items || []).forEach(applyRow);
+        syncHostEmpty();
+      }
+    };
+  }
+  connect();
+})();
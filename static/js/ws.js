@@ -6,43 +6,143 @@
   const url = `${proto}://${location.host}/ws/room/${slug}/`;
   let ws;
 
+  const pollUrl = el.getAttribute("data-poll-url");
+  const questionsUrl = el.getAttribute("data-questions-url");
+  // سرور socket عقب‌افتاده را با این کد می‌بندد (lipapp/hub.py: CLOSE_RESYNC)
+  const CLOSE_RESYNC = 4008;
+  // سرور ظرفیت handshake ندارد (CLOSE_BUSY)؛ قبلش {"event": "busy", "retry_after": s} آمده
+  const CLOSE_BUSY = 4029;
+  // آخرین seq اعمال‌شده؛ reconnect با ?since=lastSeq فقط deltaهای از دست‌رفته را می‌گیرد
+  let lastSeq = parseInt(el.getAttribute("data-seq") || "0", 10) || 0;
+
+  function swapPollBlock(html) {
+    const tmp = document.createElement("div");
+    tmp.innerHTML = html;
+    const fresh = tmp.querySelector("#poll-block");
+    const block = document.getElementById("poll-block");
+    if (!fresh || !block) return;
+    block.replaceWith(fresh);
+    window.htmx && window.htmx.process(fresh);
+  }
+
+  // فقط fragment کوچک poll-block (برای بعد از reconnect که ممکن است eventی از دست رفته باشد)
   async function refreshPollBlock() {
+    if (!pollUrl) return;
     try {
-      const res = await fetch(window.location.href, { headers: { "X-Requested-With": "fetch" } });
-      const html = await res.text();
-      const tmp = document.createElement("div");
-      tmp.innerHTML = html;
-      const fresh = tmp.querySelector("#poll-block");
-      const block = document.getElementById("poll-block");
-      if (fresh && block) block.replaceWith(fresh);
+      const res = await fetch(pollUrl, { headers: { "X-Requested-With": "fetch" } });
+      if (res.ok) swapPollBlock(await res.text());
     } catch (e) { console.warn("poll refresh failed", e); }
   }
 
+  // صفحه‌ی اول سوال‌ها را از نو می‌گیرد (وقتی سرور snapshot.required فرستاد)
+  async function refreshQuestions() {
+    const list = document.getElementById("question-list");
+    if (!questionsUrl || !list) return;
+    try {
+      const res = await fetch(questionsUrl, { headers: { "X-Requested-With": "fetch" } });
+      if (!res.ok) return;
+      list.innerHTML = await res.text();
+      window.htmx && window.htmx.process(list);
+    } catch (e) { console.warn("questions refresh failed", e); }
+  }
+
+  // tally = {poll_id, total, options: [{id, votes, pct}, ...]}
+  function patchPoll(tally) {
+    const block = document.getElementById("poll-block");
+    if (!block || block.getAttribute("data-poll") !== String(tally.poll_id)) return;
+    (tally.options || []).forEach((o) => {
+      block.querySelectorAll(`[data-option-votes="${o.id}"]`).forEach((n) => { n.textContent = o.votes; });
+      const bar = block.querySelector(`[data-option-bar="${o.id}"]`);
+      if (bar) bar.style.width = `${o.pct}%`;
+    });
+  }
+
+  const STATUS_LABELS = { pending: "Pending", approved: "Approved", rejected: "Rejected", answered: "Answered" };
+
+  // delta = {id, score, status, pinned}
+  function patchCard(delta) {
+    const card = document.getElementById(`q-${delta.id}`);
+    if (!card) return;
+    if (delta.status === "rejected") { card.remove(); return; }
+    const score = card.querySelector('[data-role="score"]');
+    if (score && delta.score !== undefined) score.textContent = delta.score;
+    const status = card.querySelector('[data-role="status"]');
+    if (status && delta.status) status.textContent = STATUS_LABELS[delta.status] || delta.status;
+    const pinned = card.querySelector('[data-role="pinned"]');
+    if (pinned && delta.pinned !== undefined) pinned.classList.toggle("hidden", !delta.pinned);
+  }
+
+  function insertCard(item) {
+    const list = document.getElementById("question-list");
+    if (!list) return;
+    const tmp = document.createElement("div");
+    tmp.innerHTML = item.html;
+    const card = tmp.firstElementChild;
+    if (!card) return;
+    const existing = document.getElementById(card.id);
+    if (existing) existing.replaceWith(card); else list.prepend(card);
+    window.htmx && window.htmx.process(card);
+  }
+
+  // exponential backoff با full jitter تا بعد از deploy همه با هم برنگردند
+  const BACKOFF_BASE = 1000;
+  const BACKOFF_MAX = 30000;
+  let attempt = 0;
+  let retryAfter = 0;
+
+  function reconnectDelay(code) {
+    if (code === CLOSE_RESYNC && attempt === 0) return 250 + Math.random() * 750;
+    const cap = Math.min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt);
+    attempt += 1;
+    const hint = code === CLOSE_BUSY ? retryAfter * 1000 : 0;
+    retryAfter = 0;
+    return hint + Math.random() * cap;
+  }
+
   function connect() {
-    const ws2 = new WebSocket(url);
-    ws2.onopen = () => console.log("ws: connected", slug);
-    ws2.onclose = () => setTimeout(connect, 1500);
+    const ws2 = new WebSocket(`${url}?since=${lastSeq}`);
+    ws2.onopen = () => console.log("ws: connected", slug, "since", lastSeq);
+    // CLOSE_RESYNC: eventهای صف دور ریخته شده‌اند؛ سریع برگرد تا replay شوند
+    ws2.onclose = (ev) => setTimeout(connect, reconnectDelay(ev.code));
     ws2.onerror = () => {};
     ws2.onmessage = (ev) => {
       let data; try { data = JSON.parse(ev.data); } catch { return; }
       const evt = data.event;
 
+      if (evt === "hello") {
+        attempt = 0;  // واقعاً پذیرفته شدیم
+        return;
+      }
+      if (evt === "busy") {
+        retryAfter = data.retry_after || 1;
+        return;
+      }
+
+      if (evt === "snapshot.required") {
+        // بازه در لاگ اتاق نیست: fragmentها را از نو بگیر و از seq فعلی ادامه بده
+        lastSeq = data.seq || 0;
+        refreshPollBlock();
+        refreshQuestions();
+        return;
+      }
+      if (data.seq) {
+        if (data.seq <= lastSeq) return;  // قبلاً (از replay یا snapshot صفحه) اعمال شده
+        lastSeq = data.seq;
+      }
+
       if (evt === "question.new") {
-        const list = document.getElementById("question-list");
-        if (!list) return;
-        const tmp = document.createElement("div");
-        tmp.innerHTML = data.html;
-        const card = tmp.firstElementChild;
-        if (card) list.prepend(card);
-      } else if (evt === "question.update" || evt === "vote.tally") {
-        const cardId = `q-${data.id}`;
-        const old = document.getElementById(cardId);
-        const tmp = document.createElement("div");
-        tmp.innerHTML = data.html;
-        const fresh = tmp.firstElementChild;
-        if (old && fresh) old.replaceWith(fresh);
+        // تکی {id, html} یا batch (moderation گروهی) {items: [{id, html}, ...]}
+        (data.items || [data]).forEach(insertCard);
+      } else if (evt === "question.update") {
+        (data.items || [data]).forEach(patchCard);
+      } else if (evt === "vote.tally") {
+        // ادغام‌شده: {items: [{id, score, status, pinned}, ...]}
+        (data.items || [data]).forEach(patchCard);
+      } else if (evt === "poll.tally") {
+        (data.items || [data]).forEach(patchPoll);
       } else if (evt === "poll.update") {
-        refreshPollBlock();
+        // html یک بار روی سرور رندر شده؛ اگر نبود، fragment را بگیر
+        if (data.html) swapPollBlock(data.html); else refreshPollBlock();
       }
     };
     ws = ws2;